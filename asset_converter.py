@@ -0,0 +1,259 @@
+# Conversion of the CMS image assets for the content directory
+#
+# Each asset is converted separately with one of the imaging backends,
+# so rather than running them one after the other, the conversions are
+# queued as jobs and then run on a bounded pool of worker processes.
+#
+# The sources of the jobs are either file paths or (zip file, member name)
+# pairs, which are read by the workers straight from the archive.
+#
+# Converted assets are also kept in a cache indexed by the contents of
+# the source image and the conversion parameters, so that unchanged
+# assets are copied from the cache rather than re-encoded on every run.
+
+import collections
+import hashlib
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+import zipfile
+
+from image_backends import (ICON_MASK_RADIUS, ICON_MASK_RECT, ICON_SIZE,
+                            JPEG_QUALITY, get_backend)
+
+CACHE_DIR = '.asset-cache'
+# Bump this to invalidate all the cached assets
+CACHE_VERSION = 2
+
+# Return the parameters other than the source image that affect
+# the output of a conversion
+def conversion_params(backend, method, size, crop):
+    params = [backend, method, str(size), str(crop)]
+    if method == 'convert':
+        params.append(str(JPEG_QUALITY))
+    else:
+        params += [str(ICON_SIZE), str(ICON_MASK_RECT), str(ICON_MASK_RADIUS)]
+    return params
+
+# Zip files opened by this process, which must not be shared with the
+# other worker processes, since reading from an archive involves seeking
+_archives = {}
+
+def read_source(source):
+    """Return the contents of a job source"""
+    if isinstance(source, tuple):
+        archive_path, name = source
+        key = (os.getpid(), archive_path)
+        if key not in _archives:
+            _archives[key] = zipfile.ZipFile(archive_path)
+        return _archives[key].read(name)
+    with open(source, 'rb') as source_file:
+        return source_file.read()
+
+def describe_source(source):
+    if isinstance(source, tuple):
+        return '%s:%s' % source
+    return source
+
+class AssetCache(object):
+    """Cache of converted assets, addressed by a hash of their inputs"""
+
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+        # Cleared once storing fails, so that a cache that cannot be
+        # written is still read from, but only warned about once
+        self.writable = True
+
+    def check_writable(self):
+        """Check that assets can be stored, warning once if they cannot"""
+        if not self.writable:
+            return False
+        tmp_path = os.path.join(self._cache_dir, '.check.%d.tmp' % os.getpid())
+        try:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            with open(tmp_path, 'w'):
+                pass
+            os.remove(tmp_path)
+        except OSError as err:
+            self._disable(err)
+        return self.writable
+
+    def _disable(self, err):
+        # The cache is only an optimization, so carry on without it
+        # (e.g., when running from a read-only checkout)
+        print('Not caching the converted assets in %s: %s' %
+              (self._cache_dir, err), file=sys.stderr)
+        self.writable = False
+
+    def get_key(self, data, params):
+        digest = hashlib.sha256()
+        digest.update(('%d\0' % CACHE_VERSION).encode('utf-8'))
+        for param in params:
+            digest.update((param + '\0').encode('utf-8'))
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _get_path(self, key, target):
+        # Keep the target extension, since it determines the output format
+        ext = os.path.splitext(target)[1]
+        return os.path.join(self._cache_dir, key[:2], key + ext)
+
+    def fetch(self, key, target):
+        """Copy a cached asset to target, returning whether it was found"""
+        try:
+            shutil.copyfile(self._get_path(key, target), target)
+        except OSError:
+            # Not cached, or the cache directory cannot be read at all
+            return False
+        return True
+
+    def store(self, key, target):
+        if not self.writable:
+            return
+        path = self._get_path(key, target)
+        # Copy to a temporary file first, so that an interrupted run
+        # or a parallel job never leaves a partial asset in the cache
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(target, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as err:
+            self._disable(err)
+
+# Result of a job, with the statistics used to profile the conversions:
+# the process that ran it, when it started and how long it took according
+# to time.perf_counter(), the size of the source and target files and
+# the number of commands run by the backend
+JobResult = collections.namedtuple('JobResult', [
+    'source', 'target', 'status', 'cached', 'pid', 'start', 'elapsed',
+    'bytes_read', 'bytes_written', 'commands'
+])
+
+def _run_job(job):
+    target, (backend, method, source, size, crop, cache) = job
+    start = time.perf_counter()
+    backend = get_backend(backend)
+    commands = backend.commands
+    key = None
+    cached = False
+    data = b''
+    try:
+        data = read_source(source)
+        if cache:
+            key = cache.get_key(data, conversion_params(backend.name, method,
+                                                        size, crop))
+            cached = cache.fetch(key, target)
+        if cached:
+            status = 0
+        else:
+            function = getattr(backend, method)
+            status = function(data, target, size, crop)
+            if status == 0 and key:
+                cache.store(key, target)
+    except Exception as err:
+        # Don't let a single broken asset take down the whole pool
+        print('Could not convert %s: %s' % (describe_source(source), err),
+              file=sys.stderr)
+        status = 127
+    if status == 0:
+        bytes_written = os.path.getsize(target)
+    else:
+        bytes_written = 0
+    return JobResult(source, target, status, cached, os.getpid(), start,
+                     time.perf_counter() - start, len(data), bytes_written,
+                     backend.commands - commands)
+
+class ConversionQueue(object):
+    """Queue of asset conversions run on a pool of worker processes
+
+    Jobs are indexed by their target, so that queueing the same target
+    twice keeps only the last conversion, as it would have been the one
+    to win had the conversions been run in order. If a cache directory
+    is given, assets are fetched from and stored in an AssetCache there.
+
+    The size and crop arguments of the conversions are those of the
+    imaging backend methods: the image is resized to fit within size,
+    or to fill it and then cropped from the center if crop is set.
+    """
+
+    def __init__(self, backend, processes=None, cache_dir=None):
+        self._backend = backend
+        self._processes = processes or os.cpu_count()
+        self._jobs = {}
+        if cache_dir:
+            self._cache = AssetCache(cache_dir)
+        else:
+            self._cache = None
+        self.converted = 0
+        self.cached = 0
+        self.elapsed = 0.0
+        self.failed = []
+        # Statistics of all the finished jobs, as JobResult tuples
+        self.results = []
+        self.bytes_read = 0
+        self.bytes_written = 0
+        # Commands run by the backend, both here and in the workers
+        self.commands = 0
+
+    def convert(self, source, target, size=None, crop=False):
+        self._jobs[target] = (self._backend, 'convert', source, size, crop,
+                              self._cache)
+
+    def round_icon(self, source, target, size=None, crop=False):
+        self._jobs[target] = (self._backend, 'round_icon', source, size, crop,
+                              self._cache)
+
+    def prepare(self):
+        """Prepare the backend, returning zero on success"""
+        backend = get_backend(self._backend)
+        commands = backend.commands
+        status = backend.prepare()
+        self.commands += backend.commands - commands
+        return status
+
+    def run(self):
+        """Run all the queued jobs, returning once they have finished"""
+        jobs = list(self._jobs.items())
+        self._jobs = {}
+        if not jobs:
+            return
+
+        # Check the cache here rather than in every job, since the jobs
+        # get their own copy of it in the worker processes
+        if self._cache:
+            self._cache.check_writable()
+
+        start = time.perf_counter()
+        with multiprocessing.Pool(self._processes) as pool:
+            for result in pool.imap_unordered(_run_job, jobs):
+                if result.cached:
+                    self.cached += 1
+                elif result.status == 0:
+                    self.converted += 1
+                else:
+                    self.failed.append((describe_source(result.source),
+                                        result.target, result.status))
+                self.results.append(result)
+                self.bytes_read += result.bytes_read
+                self.bytes_written += result.bytes_written
+                self.commands += result.commands
+        self.elapsed += time.perf_counter() - start
+
+    def print_summary(self):
+        total = self.converted + self.cached + len(self.failed)
+        if self.elapsed > 0:
+            rate = total / self.elapsed
+        else:
+            rate = 0.0
+        print('Processed %d assets with %s in %.1fs '
+              '(%.1f assets/s, %d processes): '
+              '%d converted, %d from cache, %d failed'
+              % (total, self._backend, self.elapsed, rate, self._processes,
+                 self.converted, self.cached, len(self.failed)))
+        if self.failed:
+            print('Failed to convert the following assets:')
+            for source, target, status in sorted(self.failed):
+                print('%s -> %s (exit status %d)' % (source, target, status))
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+
+# Benchmark of the content import done by unzip_content.py
+#
+# This script generates a synthetic appstore.zip with the given number
+# of apps, links and locales, with images at the dimensions of the CMS
+# assets, and then imports it into a temporary directory, timing each
+# phase of the import separately.
+#
+# The results are written as JSON, so that runs can be compared over time.
+#
+# This script requires installing Pillow
+# (sudo apt-get install python3-pil)
+# to generate the images, in addition to the requirements
+# of unzip_content.py
+#
+# Run this script from the top of the source tree, since the import
+# also reads the folders, web apps and translations from there
+
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+from image_backends import BACKENDS, DEFAULT_BACKEND
+from import_profiler import ImportProfiler
+from unzip_content import ContentImporter, LINK_LOCALES, LOCALES
+
+BENCHMARK_VERSION = 1
+
+# Dimensions of the images uploaded to the CMS
+IMAGE_SIZES = {
+    'icon': (64, 64),
+    'thumb': (340, 340),
+    'featured': (1190, 400),
+    'screenshot': (1920, 1080),
+    'splash': (1920, 1080),
+    'link-image': (200, 200),
+    'link-icon': (64, 64)
+}
+
+# Number of distinct images generated for each kind of asset,
+# which are then shared by all the assets of that kind
+IMAGE_VARIANTS = 4
+
+SCREENSHOTS_PER_APP = 3
+APPS_PER_SPLASH = 10
+LINKS_PER_CATEGORY = 10
+
+APP_CATEGORIES = ['Education', 'Games', 'Curiosity', 'Media and Entertainment',
+                  'Work', 'System and Utility']
+LINK_CATEGORIES = ['News and Media', 'Education', 'Work', 'Entertainment']
+
+class SyntheticAppstore(object):
+    """Writer of a synthetic CMS zip file"""
+
+    def __init__(self, apps, links, locales, seed=0):
+        self._apps = apps
+        self._links = links
+        # The first of the CMS locales is duplicated, since it is used both
+        # for the default and Global personalities
+        app_locales = LOCALES[1:]
+        self._app_locales = app_locales[:max(1, min(locales,
+                                                    len(app_locales)))]
+        self._link_locales = []
+        for locales in LINK_LOCALES:
+            for locale in locales:
+                if locale not in self._link_locales:
+                    self._link_locales.append(locale)
+        # The Mexican links are split from the Spanish ones by the import
+        self._link_locales.remove('es-mx')
+        self._random = random.Random(seed)
+        self._images = {}
+
+    def _get_image(self, kind, fmt, variant):
+        key = (kind, fmt, variant)
+        if key not in self._images:
+            from PIL import Image
+            # Mix smooth areas, sharp edges and some noise, so that the
+            # images compress about as well as real screenshots and photos
+            size = IMAGE_SIZES[kind]
+            detail = Image.effect_mandelbrot(size, (-2.0 + 0.1 * variant, -1.2,
+                                                    1.0, 1.2), 64)
+            gradient = Image.linear_gradient('L').resize(size)
+            noise = Image.effect_noise(size, 24)
+            image = Image.merge('RGB', [detail, gradient,
+                                        Image.blend(gradient, noise, 0.3)])
+            image_file = io.BytesIO()
+            image.save(image_file, fmt)
+            self._images[key] = image_file.getvalue()
+        return self._images[key]
+
+    def _write_image(self, zfile, path, kind):
+        if path.endswith('.png'):
+            fmt = 'PNG'
+        else:
+            fmt = 'JPEG'
+        variant = self._random.randrange(IMAGE_VARIANTS)
+        zfile.writestr(path, self._get_image(kind, fmt, variant))
+
+    def _write_apps(self, zfile):
+        apps = []
+        for i in range(self._apps):
+            app_id = 'com.example.App%d' % i
+            name = app_id.lower()
+            screenshots = {}
+            for locale in self._app_locales:
+                screenshots[locale] = []
+                for n in range(1, SCREENSHOTS_PER_APP + 1):
+                    # The CMS allows screenshots in either format
+                    if n % 2:
+                        fname = '%s-screenshot%d.jpg' % (name, n)
+                    else:
+                        fname = '%s-screenshot%d.png' % (name, n)
+                    screenshots[locale].append(fname)
+                    self._write_image(zfile, 'apps/screenshots/%s/%s' %
+                                      (locale, fname), 'screenshot')
+            self._write_image(zfile, 'apps/icons/%s-icon.png' % name, 'icon')
+            self._write_image(zfile, 'apps/thumbs/%s-thumb.jpg' % name, 'thumb')
+            self._write_image(zfile, 'apps/featured/%s-featured.jpg' % name,
+                              'featured')
+            if i % APPS_PER_SPLASH == 0:
+                splash = '%s-splash.jpg' % name
+                self._write_image(zfile, 'apps/splash/' + splash, 'splash')
+                splash_type = 'Custom'
+            else:
+                splash = ''
+                splash_type = 'Default'
+            apps.append({
+                'application-id': app_id,
+                'category': self._random.choice(APP_CATEGORIES),
+                'core': i % 5 == 0,
+                'custom-splash-screen': splash,
+                'description': 'Description of app %d' % i,
+                'desktop-position': None,
+                'exec': name,
+                'folder': 'none',
+                'icon': '%s-icon.png' % name,
+                'personalities': ['All'],
+                'screenshots': screenshots,
+                'splash-screen-type': splash_type,
+                'square_img': '%s-thumb.jpg' % name,
+                'subtitle': 'Subtitle of app %d' % i,
+                'title': 'App %d' % i,
+                'tryexec': ''
+            })
+        zfile.writestr('apps/content.json', json.dumps(apps, indent=2))
+
+    def _write_links(self, zfile):
+        categories = {}
+        for i in range(self._links):
+            category = LINK_CATEGORIES[(i // LINKS_PER_CATEGORY) %
+                                       len(LINK_CATEGORIES)]
+            categories.setdefault(category, []).append(i)
+            link_id = 'link%d' % i
+            self._write_image(zfile, 'links/images/%s.jpg' % link_id,
+                              'link-image')
+            # Half of the links come with a designer icon, while the icons
+            # of the others are generated from their images
+            if i % 2:
+                self._write_image(zfile, 'links/icons/%s.png' % link_id,
+                                  'link-icon')
+
+        for n, locale in enumerate(self._link_locales):
+            json_data = []
+            for category, links in sorted(categories.items()):
+                json_links = []
+                for i in links:
+                    link_id = 'link%d' % i
+                    # Only the links of the first locales are localized
+                    if n < len(self._app_locales):
+                        suffix = ' (%s)' % locale
+                    else:
+                        suffix = ''
+                    json_links.append({
+                        'linkCategory': category,
+                        'linkDesktopPosition': None,
+                        'linkFolder': 'none',
+                        'linkIcon': 'icons/%s.png' % link_id if i % 2
+                                    else 'icons/',
+                        'linkId': link_id,
+                        'linkName': 'Link %d%s' % (i, suffix),
+                        'linkRegion': 'Mexico' if i % 10 == 9 else 'Global',
+                        'linkSubtitle': 'Subtitle of link %d' % i,
+                        'linkUrl': 'http://example.com/%s/%s' % (locale,
+                                                                 link_id)
+                    })
+                json_data.append({'category': category, 'links': json_links})
+            zfile.writestr('links/%s.json' % locale,
+                           json.dumps(json_data, indent=2))
+
+    def write(self, path):
+        with zipfile.ZipFile(path, 'w') as zfile:
+            self._write_apps(zfile)
+            self._write_links(zfile)
+
+def run_benchmark(zip_filename, runs, backend, jobs):
+    results = []
+    for run in range(runs):
+        output_dir = tempfile.mkdtemp(prefix='benchmark-import-')
+        try:
+            # Don't use the asset cache, so that every run converts
+            # all the images
+            importer = ContentImporter(zip_filename, output_dir, backend,
+                                       jobs, None)
+            profiler = ImportProfiler(importer.converter)
+            start = time.perf_counter()
+            importer.run(profiler)
+            total = time.perf_counter() - start
+        finally:
+            shutil.rmtree(output_dir, True)
+        converter = importer.converter
+        if converter.failed:
+            converter.print_summary()
+            exit(1)
+        print('Run %d: %.2fs' % (run + 1, total), file=sys.stderr)
+        phases = {}
+        for stats in profiler.phases:
+            phases[stats.name] = {
+                'wall': stats.wall,
+                'cpu': stats.cpu,
+                'children_cpu': stats.children_cpu,
+                'processes': stats.processes,
+                'bytes_read': stats.bytes_read,
+                'bytes_written': stats.bytes_written
+            }
+        results.append({
+            'phases': phases,
+            'total': total,
+            'assets': converter.converted
+        })
+    return results
+
+def summarize(results):
+    summary = {}
+    for key in ContentImporter.PHASES + ['total']:
+        if key == 'total':
+            times = sorted(result['total'] for result in results)
+        else:
+            times = sorted(result['phases'][key]['wall']
+                           for result in results)
+        summary[key] = {
+            'min': times[0],
+            'median': times[len(times) // 2],
+            'max': times[-1]
+        }
+    return summary
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description='Benchmark the content import')
+    parser.add_argument('-n', '--apps', type=int, default=50,
+                        help='number of apps (default: %(default)s)')
+    parser.add_argument('-m', '--links', type=int, default=50,
+                        help='number of links (default: %(default)s)')
+    parser.add_argument('-k', '--locales', type=int, default=2,
+                        help='number of locales with screenshots and ' +
+                        'localized links (default: %(default)s)')
+    parser.add_argument('-r', '--runs', type=int, default=3,
+                        help='number of imports to time ' +
+                        '(default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of image conversions to run in ' +
+                        'parallel (default: number of CPUs)')
+    parser.add_argument('--backend', choices=sorted(BACKENDS),
+                        default=DEFAULT_BACKEND,
+                        help='imaging backend used to convert images ' +
+                        '(default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the generated content ' +
+                        '(default: %(default)s)')
+    parser.add_argument('-z', '--zipfile',
+                        help='import this zip file rather than ' +
+                        'a generated one')
+    parser.add_argument('-o', '--output',
+                        help='file in which to write the results ' +
+                        '(default: standard output)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='benchmark-import-') as tmp_dir:
+        if args.zipfile:
+            zip_filename = args.zipfile
+        else:
+            zip_filename = os.path.join(tmp_dir, 'appstore.zip')
+            print('Generating %s' % zip_filename, file=sys.stderr)
+            SyntheticAppstore(args.apps, args.links, args.locales,
+                              args.seed).write(zip_filename)
+        zip_size = os.path.getsize(zip_filename)
+        results = run_benchmark(zip_filename, args.runs, args.backend,
+                                args.jobs)
+
+    report = {
+        'version': BENCHMARK_VERSION,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'params': {
+            'apps': args.apps,
+            'links': args.links,
+            'locales': args.locales,
+            'seed': args.seed,
+            'zipfile': args.zipfile,
+            'zip_size': zip_size,
+            'backend': args.backend,
+            'jobs': args.jobs or os.cpu_count()
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'runs': results,
+        'summary': summarize(results)
+    }
+
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=2, sort_keys=True)
+            outfile.write('\n')
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
@@ -0,0 +1,51 @@
+# Index of the entries of the .po files, for the scripts that sync
+# the app content with the spreadsheet
+#
+# polib's find() scans the whole catalog for every lookup, so the entries
+# are rather indexed by message and context when the catalog is loaded.
+
+import os
+
+import polib
+
+class CatalogIndex(object):
+    """Index of the entries of a polib catalog by (msgid, msgctxt)
+
+    Lookups fall back to the first entry with the same msgid in any
+    context, which is the one that find() would return, so catalogs
+    without contexts work as before. Obsolete entries are ignored,
+    as find() does.
+    """
+
+    def __init__(self, po):
+        self.po = po
+        self._entries = {}
+        self._by_msgid = {}
+        for entry in po:
+            if not entry.obsolete:
+                self._add(entry)
+
+    def _add(self, entry):
+        self._entries.setdefault((entry.msgid, entry.msgctxt), entry)
+        self._by_msgid.setdefault(entry.msgid, entry)
+
+    def find(self, msgid, msgctxt=None):
+        entry = self._entries.get((msgid, msgctxt))
+        if entry is None:
+            entry = self._by_msgid.get(msgid)
+        return entry
+
+    def append(self, entry):
+        self.po.append(entry)
+        self._add(entry)
+
+    def save(self, path=None):
+        self.po.save(path)
+
+def load_catalogs(po_dir, langs):
+    """Load and index the .po file of each of langs"""
+    catalogs = {}
+    for lang in langs:
+        po_file = os.path.join(po_dir, lang + '.po')
+        catalogs[lang] = CatalogIndex(polib.pofile(po_file))
+    return catalogs
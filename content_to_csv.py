@@ -14,9 +14,15 @@
 # 4. Merge changes into master content doc
 
 import csv
-import json
 import os
-import polib
+import sys
+
+from catalog_index import load_catalogs
+
+# The content index is shared with the installed tools
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                'tools'))
+from eoscontentindex import load_content_index
 
 CONTENT_JSON = 'content/Default/apps/content.json'
 CONTENT_CSV = 'content.csv'
@@ -24,111 +30,97 @@ PO_DIR = 'po'
 LANGS = {'en': 'GLOBAL',
          'es': 'SPANISH',
          'pt_BR': 'PORTUGUESE'}
+FIELDS = ['title', 'subtitle', 'description']
+
+# Write the rows of csv_reader to csv_writer, filling them in
+# from the content json and the translations
+def update_csv(csv_reader, csv_writer, content_index, catalogs):
+    # Read and parse the three-row header
+    header1 = next(csv_reader)
+    header2 = next(csv_reader)
+    header3 = next(csv_reader)
+    lang_idx = {}
+    for lang in LANGS:
+        lang_idx[lang] = header1.index(LANGS[lang])
+    appid_idx = header2.index('App Id')
+    origname_idx = header2.index('Original Name')
+    num_cols = len(header2)
+
+    def populate_row(csv_row, json_row):
+        csv_row[appid_idx] = json_row['application-id']
+
+        def translate(lang, val, msgctxt):
+            entry = catalogs[lang].find(val, msgctxt)
+            if entry:
+                translation = entry.msgstr
+            else:
+                translation = ''
+            return translation
 
-if __name__ == '__main__':
-
-    # Load the content json data from file
-    with open(CONTENT_JSON) as json_file:
-        json_data = json.load(json_file)
-
-    # Open the input csv reader
-    with open(CONTENT_CSV, newline='') as in_file:
-        in_lines = in_file.readlines()
-    csv_reader = csv.reader(in_lines)
-
-    # Open the output csv writer
-    with open(CONTENT_CSV, 'w', newline='') as out_file:
-        csv_writer = csv.writer(out_file, lineterminator='\n')
-
-        # Read and parse the three-row header
-        header1 = csv_reader.__next__()
-        header2 = csv_reader.__next__()
-        header3 = csv_reader.__next__()
-        lang_idx = {}
         for lang in LANGS:
-            lang_idx[lang] = header1.index(LANGS[lang])
-        appid_idx = header2.index('App Id')
-        origname_idx = header2.index('Original Name')
-        num_cols = len(header2)
-        empty_row = [''] * num_cols
-
-        # Open po files
-        po = {}
-        for lang in LANGS:
-            if lang != 'en':
-                po_file = os.path.join(PO_DIR, lang + '.po')
-                po[lang] = polib.pofile(po_file)
-
-        def populate_row(csv_row, json_row):
-            csv_row[appid_idx] = json_row['application-id']
-            en_title = json_row['title']
-            en_subtitle = json_row['subtitle']
-            en_description = json_row['description']
-
-            def translate(lang, val):
-                entry = po[lang].find(val)
-                if entry:
-                    translation = entry.msgstr
-                else:
-                    translation = ''
-                return translation
-
-            for lang in LANGS:
-                title_idx = lang_idx[lang]
-                subtitle_idx = lang_idx[lang] + 1
-                description_idx = lang_idx[lang] + 2
-                if (lang == 'en'):
-                    title = en_title
-                    subtitle = en_subtitle
-                    description = en_description
-                else:
-                    title = translate(lang, en_title)
-                    subtitle = translate(lang, en_subtitle)
-                    description = translate(lang, en_description)
-                csv_row[title_idx] = title
-                csv_row[subtitle_idx] = subtitle
-                csv_row[description_idx] = description
-
-        # Write the three-row header
-        csv_writer.writerow(header1)
-        csv_writer.writerow(header2)
-        csv_writer.writerow(header3)
-
-        # Process each row of the input csv
-        for csv_row in csv_reader:
-            app_id = csv_row[appid_idx]
-            if app_id:
-                # Csv already has app id: search for it in json
-                for json_row in json_data:
-                    if json_row['application-id'] == app_id:
-                        # Found a match in json
-                        break
-                else:
-                    # No match in json: leave the csv alone
-                    json_row = None
-            else:
-                # Csv does not have app id yet: try searching by original name
-                orig_name = csv_row[origname_idx]
-                for json_row in json_data:
-                    if json_row['title'] == orig_name:
-                        # Found a matching name
-                        break
-                else:
-                    # No matching name: leave the csv alone
-                    json_row = None
-
-            # If matching json content found, use it to fill part of the csv,
-            # and mark the json data as having been used
-            if json_row:
-                populate_row(csv_row, json_row)
-                json_row['used'] = True
-
-            # Write the possibly modified csv row
+            for i, field in enumerate(FIELDS):
+                val = json_row[field]
+                if lang != 'en':
+                    val = translate(lang, val, field)
+                csv_row[lang_idx[lang] + i] = val
+
+    # Write the three-row header
+    csv_writer.writerow(header1)
+    csv_writer.writerow(header2)
+    csv_writer.writerow(header3)
+
+    # The json content already in the csv, by identity,
+    # since several apps may have the same ID
+    used = set()
+
+    # Process each row of the input csv
+    for csv_row in csv_reader:
+        app_id = csv_row[appid_idx]
+        if app_id:
+            # Csv already has app id: search for it in json
+            # (if no match in json, leave the csv alone)
+            json_row = content_index.get(app_id)
+        else:
+            # Csv does not have app id yet: try searching by original name
+            # (if no matching name, leave the csv alone)
+            orig_name = csv_row[origname_idx]
+            json_row = content_index.get_by_title(orig_name)
+
+        # If matching json content found, use it to fill part of the csv,
+        # and mark the json data as having been used
+        if json_row:
+            populate_row(csv_row, json_row)
+            used.add(id(json_row))
+
+        # Write the possibly modified csv row
+        csv_writer.writerow(csv_row)
+
+    # Append any additional content from json that is not yet in csv
+    for json_row in content_index:
+        if id(json_row) not in used:
+            csv_row = [''] * num_cols
+            populate_row(csv_row, json_row)
             csv_writer.writerow(csv_row)
 
-        # Append any additional content from json that is not yet in csv
-        for json_row in json_data:
-            if not 'used' in json_row:
-                csv_row = empty_row
-                populate_row(csv_row, json_row)
-                csv_writer.writerow(csv_row)
+if __name__ == '__main__':
+
+    # Load the content json data from file
+    content_index = load_content_index(CONTENT_JSON)
+
+    # Open po files
+    catalogs = load_catalogs(PO_DIR, [lang for lang in LANGS if lang != 'en'])
+
+    # Write the updated csv to a temporary file while reading the
+    # current one, and only replace the current one once complete,
+    # so that an error never leaves a truncated csv behind
+    tmp_path = '%s.%d.tmp' % (CONTENT_CSV, os.getpid())
+    try:
+        with open(CONTENT_CSV, newline='') as in_file, \
+                open(tmp_path, 'w', newline='') as out_file:
+            csv_reader = csv.reader(in_file)
+            csv_writer = csv.writer(out_file, lineterminator='\n')
+            update_csv(csv_reader, csv_writer, content_index, catalogs)
+        os.replace(tmp_path, CONTENT_CSV)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
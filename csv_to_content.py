@@ -41,6 +41,14 @@ import csv
 import json
 import os
 import polib
+import sys
+
+from catalog_index import load_catalogs
+
+# The content index is shared with the installed tools
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                'tools'))
+from eoscontentindex import load_content_index
 
 CONTENT_JSON = 'content/Default/apps/content.json'
 CONTENT_CSV = 'content.csv'
@@ -48,102 +56,163 @@ PO_DIR = 'po'
 LANGS = {'en': 'GLOBAL',
          'es': 'SPANISH',
          'pt_BR': 'PORTUGUESE'}
+FIELDS = ['title', 'subtitle', 'description']
+
+# For now, we don't support any new-lines within the description,
+# so replace any newlines with spaces
+# Double-quotes are also problematic, so replace them
+# with single-quotes
+def sanitize(val):
+    return val.strip().replace('\n', ' ').replace('"', "'")
+
+class ContentSync(object):
+    """Sync of the content json and po files with the spreadsheet
+
+    The apps are looked up in the content index by ID, and the po
+    entries by (msgid, msgctxt), so the spreadsheet is processed in a
+    single pass over its rows. Every change is recorded in the diff,
+    with the apps changed by ID and the translations changed or added
+    by language.
+    """
+
+    def __init__(self, content_index, catalogs):
+        self._content_index = content_index
+        self._catalogs = catalogs
+        self.diff = {
+            'apps': {},
+            'translations': dict((lang, {'changed': [], 'added': []})
+                                 for lang in catalogs),
+            'warnings': []
+        }
+
+    def _warn(self, message):
+        print('Warning: ' + message)
+        self.diff['warnings'].append(message)
+
+    def _update_field(self, json_row, field, val):
+        old_val = json_row.get(field)
+        if old_val != val:
+            json_row[field] = val
+            app_diff = self.diff['apps'].setdefault(
+                json_row['application-id'], {})
+            app_diff[field] = [old_val, val]
+
+    def _translate(self, lang, val, translation, msgctxt):
+        catalog = self._catalogs[lang]
+        changes = self.diff['translations'][lang]
+        entry = catalog.find(val, msgctxt)
+        if entry:
+            if entry.msgstr != translation:
+                changes['changed'].append({'msgid': val, 'msgctxt': msgctxt,
+                                           'old': entry.msgstr,
+                                           'new': translation})
+                entry.msgstr = translation
+        else:
+            entry = polib.POEntry(msgid=val,
+                                  msgstr=translation,
+                                  msgctxt=msgctxt)
+            catalog.append(entry)
+            changes['added'].append({'msgid': val, 'msgctxt': msgctxt,
+                                     'new': translation})
+
+    def update_row(self, csv_row, json_row, lang_idx):
+        en_idx = lang_idx['en']
+        en_values = [sanitize(csv_row[en_idx + i]) for i in range(len(FIELDS))]
+        for field, val in zip(FIELDS, en_values):
+            self._update_field(json_row, field, val)
+
+        for lang in self._catalogs:
+            for i, field in enumerate(FIELDS):
+                translation = sanitize(csv_row[lang_idx[lang] + i])
+                self._translate(lang, en_values[i], translation, field)
+
+    def sync(self, csv_file):
+        csv_reader = csv.reader(csv_file)
+
+        # Read and parse the three-row header
+        header1 = next(csv_reader)
+        header2 = next(csv_reader)
+        header3 = next(csv_reader)
+        lang_idx = {}
+        for lang in LANGS:
+            lang_idx[lang] = header1.index(LANGS[lang])
+        appid_idx = header2.index('App Id')
+        title_idx = lang_idx['en']
+
+        # Process each row of the input csv, as it is read
+        for csv_row in csv_reader:
+            app_id = csv_row[appid_idx]
+            if app_id:
+                # Csv has app id: search for it in json
+                json_row = self._content_index.get(app_id)
+                if not json_row:
+                    # No match in json: ignore the row
+                    self._warn('app id %s not found in content.json' % app_id)
+            else:
+                # Csv has no app id: ignore the row
+                self._warn('no app id specified for %s' % csv_row[title_idx])
+                json_row = None
+
+            # If matching json content found, update it per the csv row
+            if json_row:
+                self.update_row(csv_row, json_row, lang_idx)
+
+    def get_changed_langs(self):
+        changed = []
+        for lang, changes in sorted(self.diff['translations'].items()):
+            if changes['changed'] or changes['added']:
+                changed.append(lang)
+        return changed
+
+    def print_diff(self):
+        for app_id, fields in sorted(self.diff['apps'].items()):
+            print('App %s: changed %s' % (app_id, ', '.join(sorted(fields))))
+        for lang, changes in sorted(self.diff['translations'].items()):
+            for change in changes['changed']:
+                print('%s: changed %s "%s"' % (lang, change['msgctxt'],
+                                               change['msgid']))
+            for change in changes['added']:
+                print('%s: added %s "%s"' % (lang, change['msgctxt'],
+                                             change['msgid']))
+        print('%d apps changed, translations changed in %d languages' %
+              (len(self.diff['apps']), len(self.get_changed_langs())))
 
 if __name__ == '__main__':
 
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description='Update the content json and ' +
+                            'po files from the content spreadsheet')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='report the changes without writing them')
+    parser.add_argument('--diff', metavar='FILE',
+                        help='write the changes as JSON to FILE')
+    args = parser.parse_args()
+
     # Load the content json data from file
-    with open(CONTENT_JSON) as json_file:
-        json_data = json.load(json_file)
+    content_index = load_content_index(CONTENT_JSON)
+    json_data = content_index.apps
+
+    # Open po files
+    catalogs = load_catalogs(PO_DIR, [lang for lang in LANGS if lang != 'en'])
 
-    # Open the input csv reader
+    content_sync = ContentSync(content_index, catalogs)
     with open(CONTENT_CSV, newline='') as in_file:
-        in_lines = in_file.readlines()
-    csv_reader = csv.reader(in_lines)
-
-    # Read and parse the three-row header
-    header1 = csv_reader.__next__()
-    header2 = csv_reader.__next__()
-    header3 = csv_reader.__next__()
-    lang_idx = {}
-    for lang in LANGS:
-        lang_idx[lang] = header1.index(LANGS[lang])
-    appid_idx = header2.index('App Id')
-    title_idx = lang_idx['en']
-    num_cols = len(header2)
-    empty_row = [''] * num_cols
+        content_sync.sync(in_file)
+    content_sync.print_diff()
 
-    # Open po files
-    po = {}
-    for lang in LANGS:
-        if lang != 'en':
-            po_file = os.path.join(PO_DIR, lang + '.po')
-            po[lang] = polib.pofile(po_file)
-
-    # For now, we don't support any new-lines within the description,
-    # so replace any newlines with spaces
-    # Double-quotes are also problematic, so replace them
-    # with single-quotes
-    def sanitize(val):
-        return val.strip().replace('\n', ' ').replace('"', "'")
-
-    def update_row(csv_row, json_row):
-        en_title = sanitize(csv_row[lang_idx['en']])
-        en_subtitle = sanitize(csv_row[lang_idx['en'] + 1])
-        en_description = sanitize(csv_row[lang_idx['en'] + 2])
-        json_row['title'] = en_title
-        json_row['subtitle'] = en_subtitle
-        json_row['description'] = en_description
-
-        def translate(lang, val, translation, msgctxt):
-            entry = po[lang].find(val)
-            if entry:
-                entry.msgstr = translation
-            else:
-                entry = polib.POEntry(msgid=val,
-                                      msgstr=translation,
-                                      msgctxt=msgctxt)
-                po[lang].append(entry)
+    if args.diff:
+        with open(args.diff, 'w') as diff_file:
+            json.dump(content_sync.diff, diff_file, indent=2, sort_keys=True)
 
-        for lang in LANGS:
-            if lang != 'en':
-                title_idx = lang_idx[lang]
-                subtitle_idx = lang_idx[lang] + 1
-                description_idx = lang_idx[lang] + 2
-                title = sanitize(csv_row[title_idx])
-                subtitle = sanitize(csv_row[subtitle_idx])
-                description = sanitize(csv_row[description_idx])
-                translate(lang, en_title, title, 'title')
-                translate(lang, en_subtitle, subtitle, 'subtitle')
-                translate(lang, en_description, description, 'description')
-
-    # Process each row of the input csv
-    for csv_row in csv_reader:
-        app_id = csv_row[appid_idx]
-        if app_id:
-            # Csv has app id: search for it in json
-            for json_row in json_data:
-                if json_row['application-id'] == app_id:
-                    # Found a match in json
-                    break
-            else:
-                # No match in json: ignore the row
-                print('Warning: app id %s not found in content.json' % app_id)
-                json_row = None
-        else:
-            # Csv has no app id: ignore the row
-            print('Warning: no app id specified for %s' % csv_row[title_idx])
-            json_row = None
-
-        # If matching json content found, update it per the csv row
-        if json_row:
-            update_row(csv_row, json_row)
-
-    # Re-write the content json file with any modifications
-    with open(CONTENT_JSON, 'w') as json_file:
-        json.dump(json_data, json_file, indent=2, sort_keys=True)
-
-    # Re-write the po files with any modifications
-    for lang in LANGS:
-        if lang != 'en':
-            po_file = os.path.join(PO_DIR, lang + '.po')
-            po[lang].save(po_file)
+    if args.dry_run:
+        exit()
+
+    # Re-write the content json file if modified
+    if content_sync.diff['apps']:
+        with open(CONTENT_JSON, 'w') as json_file:
+            json.dump(json_data, json_file, indent=2, sort_keys=True)
+
+    # Re-write the po files that were modified
+    for lang in content_sync.get_changed_langs():
+        po_file = os.path.join(PO_DIR, lang + '.po')
+        catalogs[lang].save(po_file)
@@ -1,7 +1,27 @@
 import os
 import urllib.parse
 
+WEB_APPS_FILE = 'web-apps.txt'
+
+_web_apps = {}
+
+# Read the list of links to turn into web apps, only once for each file
+def load_web_apps(path=WEB_APPS_FILE):
+    if path not in _web_apps:
+        with open(path) as web_apps_file:
+            _web_apps[path] = frozenset(line.strip() for line in web_apps_file
+                                        if line.strip())
+    return _web_apps[path]
+
 class DesktopObject(object):
+    """Desktop entry of a link, app or folder from the CMS
+
+    The values of all the keys are resolved from the CMS data when the
+    object is created, rather than each time they are written, and only
+    the values are kept, rather than the whole CMS data.
+    """
+
+    __slots__ = ['_values', '_desktop_dir']
 
     DESKTOP_KEYS = [
         'Version',
@@ -16,80 +36,107 @@ class DesktopObject(object):
         'X-Endless-LaunchMaximized',
         'X-Endless-SplashBackground'
     ]
-        
-    def __init__(self, data):
-        self._locale_keys = ['Name', 'Comment']
-        self._suffix = '.desktop.in'
-        self._data = data
 
-        self.defaults = {}
-        self.defaults['Version'] = '1.0'
-        self.defaults['Type'] = 'Application'
-        self.defaults['StartupWMClass'] = None
+    LOCALE_KEYS = frozenset(['Name', 'Comment'])
 
-    def get(self, key):
-        if key in self.json_keys:
-            val = self._data[self.json_keys[key]]
-            if key == 'Icon':
-                return self._icon_prefix + val
-            if key == 'TryExec':
-                if not val:
-                    # Convert empty string to None to avoid writing field
-                    return None
-                return val
-            if key == 'Categories':
-                if val is None:
-                    return ''
-                categories = ';'.join(val.split(' and '))
-                if not categories.endswith(';'):
-                    categories += ';'
-                return categories
-            if key == 'X-Endless-LaunchMaximized':
-                # In the CMS, the splash screen type serves a double duty:
-                # if the type is 'None', we don't launch maximized
-                if val in ['Default', 'Custom']:
-                    return 'true'
-                else:
-                    return 'false'
-            if key == 'X-Endless-SplashBackground':
-                if val:
-                    return val
-                else:
-                    return None
+    # Keys whose values are taken from the CMS data
+    json_keys = {}
+
+    # Values of the keys that are not in the CMS data
+    defaults = {
+        'Version': '1.0',
+        'Type': 'Application',
+        'StartupWMClass': None
+    }
+
+    prefix = ''
+    suffix = '.desktop.in'
+    icon_prefix = ''
+
+    def __init__(self, data, desktop_dir):
+        self._desktop_dir = desktop_dir
+        values = dict.fromkeys(self.DESKTOP_KEYS)
+        values.update(self.defaults)
+        for key, json_key in self.json_keys.items():
+            # The position is only needed on demand, so don't require it
+            if key in ['Index', 'Folder']:
+                val = data.get(json_key)
             else:
-                return val
-        elif key in self.defaults:
-            return self.defaults[key]
-        elif key == 'Position':
-            folder = self.get('Folder')
-            index = self.get('Index')
-            if folder == 'none' or folder == '' or index is None:
+                val = data[json_key]
+            values[key] = self._convert(key, val)
+        self._values = values
+
+    def _convert(self, key, val):
+        if key == 'Icon':
+            return self.icon_prefix + val
+        if key == 'TryExec':
+            if not val:
+                # Convert empty string to None to avoid writing field
                 return None
-            elif folder == 'desktop' or folder == 'default':
-                return index
+            return val
+        if key == 'Categories':
+            if val is None:
+                return ''
+            categories = ';'.join(val.split(' and '))
+            if not categories.endswith(';'):
+                categories += ';'
+            return categories
+        if key == 'X-Endless-LaunchMaximized':
+            # In the CMS, the splash screen type serves a double duty:
+            # if the type is 'None', we don't launch maximized
+            if val in ['Default', 'Custom']:
+                return 'true'
+            else:
+                return 'false'
+        if key == 'X-Endless-SplashBackground':
+            if val:
+                return val
             else:
-                return folder + ':' + index
+                return None
+        return val
+
+    def _get_position(self):
+        folder = self._values.get('Folder')
+        index = self._values.get('Index')
+        if folder == 'none' or folder == '' or index is None:
+            return None
+        elif folder == 'desktop' or folder == 'default':
+            return index
         else:
-            raise AttributeError
+            return folder + ':' + index
+
+    def get(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            if key == 'Position':
+                return self._get_position()
+            raise AttributeError(key)
 
     def write_key(self, handle, key):
-        val = self.get(key)
+        val = self._values[key]
         if val is not None:
             line = '%s=%s\n' % (key, val)
-            if self.key_is_localized(key):
+            if key in self.LOCALE_KEYS:
                 line = '_' + line
 
             handle.write(line)
-    
+
     def key_is_localized(self, key):
-        return key in self._locale_keys
+        return key in self.LOCALE_KEYS
+
+    def get_desktop_dir(self):
+        return self._desktop_dir
 
     def get_desktop_path(self):
-        return os.path.join(self.get_desktop_dir(),
-                            self._prefix + self.get('Id') + self._suffix)
+        return os.path.join(self._desktop_dir,
+                            self.prefix + self._values['Id'] + self.suffix)
 
 class LinkObject(DesktopObject):
 
+    __slots__ = ['_default_name', '_name_locales', '_localized_names',
+                 '_url_locales', '_localized_urls']
+
     json_keys = {
         'Name': 'linkName',
         'Comment': 'linkSubtitle',
@@ -101,31 +148,40 @@ class LinkObject(DesktopObject):
         'Folder': 'linkFolder'
     }
 
-    def __init__(self, data, desktop_dir, locale):
-        super(LinkObject, self).__init__(data)
-        self._desktop_dir = desktop_dir
-        self._default_name = self._data['linkName']
+    prefix = 'eos-link-'
+    icon_prefix = 'eos-link-'
+
+    # The web apps may be given as a set of link IDs, and are otherwise
+    # read from WEB_APPS_FILE
+    def __init__(self, data, desktop_dir, locale, web_apps=None):
+        super(LinkObject, self).__init__(data, desktop_dir)
+        self._default_name = self._values['Name']
         self._name_locales = []
         self._localized_names = {}
-        self._default_url = self.get('URL')
         self._url_locales = []
         self._localized_urls = {}
-        self._prefix = 'eos-link-'
-        self._icon_prefix = 'eos-link-'
 
-        # Read the list of links to turn into web apps
-        with open('web-apps.txt') as web_apps_file:
-            self._web_apps = web_apps_file.read().strip().split('\n')
+        if web_apps is None:
+            web_apps = load_web_apps()
+        values = self._values
+        values['X-Endless-LaunchMaximized'] = 'true'
+        values['TryExec'] = None
+        values['X-Endless-SplashBackground'] = None
+        if values['Id'] in web_apps:
+            values['StartupWMClass'] = self._get_startup_wmclass()
+        values['Exec'] = self._get_exec()
 
     def append_localized_name(self, locale, name):
         if name != self._default_name:
             self._name_locales.append(locale)
             self._localized_names[locale] = name
+            self._values['Name'] = self._get_names()
 
     def append_localized_url(self, locale, url):
-        if url != self._default_url:
+        if url != self._values['URL']:
             self._url_locales.append(locale)
             self._localized_urls[locale] = url
+            self._values['Exec'] = self._get_exec()
 
     def _get_names(self):
         name_string = self._default_name
@@ -135,22 +191,25 @@ class LinkObject(DesktopObject):
         return name_string
 
     def _get_exec(self):
+        default_url = self._values['URL']
+
         # If this link is white-listed as a web app,
         # include the appropriate command
-        if self.get('Id') in self._web_apps:
-            webapp_prefix = 'webapp:' +  self._get_startup_wmclass() + '@'
+        wmclass = self._values['StartupWMClass']
+        if wmclass is not None:
+            webapp_prefix = 'webapp:' + wmclass + '@'
         else:
             webapp_prefix = ''
 
         # If there's only one URL for this link,
         # just return an exec which opens that url in the browser.
         if len(self._url_locales) == 0:
-            return 'gio open ' + webapp_prefix + self._default_url
+            return 'gio open ' + webapp_prefix + default_url
 
         # Otherwise, send each url with its respective locale 
         # to eos-exec-localized.
         exec_str = 'eos-exec-localized '
-        exec_str += '\'gio open ' + webapp_prefix + self._default_url + '\' '
+        exec_str += '\'gio open ' + webapp_prefix + default_url + '\' '
 
         # Process locales in the same order they were appended
         for locale in self._url_locales:
@@ -159,44 +218,25 @@ class LinkObject(DesktopObject):
 
         return exec_str
 
+    # If this link is white-listed as a web app,
+    # add the window manager class field so that the launched
+    # web app uses its own taskbar icon.
+    # Note that for localized execs, this only works properly
+    # for the default URL -- other locales will have the
+    # windows associated with the browser taskbar icon.
     def _get_startup_wmclass(self):
-        # If this link is white-listed as a web app,
-        # add the window manager class field so that the launched
-        # web app uses its own taskbar icon.
-        # Note that for localized execs, this only works properly
-        # for the default URL -- other locales will have the
-        # windows associated with the browser taskbar icon.
-        if self.get('Id') in self._web_apps:
-            parsed = urllib.parse.urlparse(self._default_url)
-            wmclass = parsed.netloc
-            trimmed_path = parsed.path.rstrip('/')
-            if trimmed_path:
-                wmclass += '_'
-                wmclass += trimmed_path.replace('/', '_')
-            return wmclass
-        else:
-            return None
-
-    def get(self, key):
-        if key == 'Name':
-            return self._get_names()
-        elif key == 'Exec':
-            return self._get_exec()
-        elif key == 'StartupWMClass':
-            return self._get_startup_wmclass()
-        elif key == 'X-Endless-LaunchMaximized':
-            return 'true'
-        elif key in ['TryExec',
-                     'X-Endless-SplashBackground']:
-            return None
-        else:
-            return super(LinkObject, self).get(key)
-
-    def get_desktop_dir(self):
-        return self._desktop_dir
+        parsed = urllib.parse.urlparse(self._values['URL'])
+        wmclass = parsed.netloc
+        trimmed_path = parsed.path.rstrip('/')
+        if trimmed_path:
+            wmclass += '_'
+            wmclass += trimmed_path.replace('/', '_')
+        return wmclass
 
 class AppObject(DesktopObject):
 
+    __slots__ = []
+
     json_keys = {
         'Name': 'title',
         'Id': 'application-id',
@@ -213,40 +253,18 @@ class AppObject(DesktopObject):
         'X-Endless-SplashBackground': 'custom-splash-screen'
     }
 
-    def __init__(self, data, bundle_desktop_dir):
-        super(AppObject, self).__init__(data)
-        self._bundle_desktop_dir = bundle_desktop_dir
-        self._prefix = ''
-        self._icon_prefix = 'eos-app-'
-
-    def get_desktop_dir(self):
-        return self._bundle_desktop_dir
+    icon_prefix = 'eos-app-'
 
 class FolderObject(DesktopObject):
 
+    __slots__ = []
+
     json_keys = {
         'Id': 'folderId',
         'Name': 'folderName'
     }
 
-    def __init__(self, data, desktop_dir):
-        super(FolderObject, self).__init__(data)
-        self._desktop_dir = desktop_dir
-        self._prefix = 'eos-folder-'
-        self._suffix = '.directory.in'
-        self.defaults['Type'] = 'Directory'
+    defaults = dict(DesktopObject.defaults, Type='Directory')
 
-    def get(self, key):
-        if key in ['Comment',
-                   'Exec',
-                   'TryExec',
-                   'Icon',
-                   'Categories',
-                   'X-Endless-LaunchMaximized',
-                   'X-Endless-SplashBackground']:
-            return None
-        else:
-            return super(FolderObject, self).get(key)
-
-    def get_desktop_dir(self):
-        return self._desktop_dir
+    prefix = 'eos-folder-'
+    suffix = '.directory.in'
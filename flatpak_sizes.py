@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+# Installed sizes of the flatpak apps, for the app reports
+#
+# The sizes listed by the remotes are parsed from flatpak remote-ls, while
+# the apps deployed on this machine are measured by walking their trees,
+# with the sizes cached by commit so that later reports don't walk them
+# again.
+
+import json
+import os
+import re
+import sys
+
+# Installations in which to look for deployed flatpaks
+FLATPAK_DIRS = ['/var/lib/flatpak',
+                os.path.expanduser('~/.local/share/flatpak')]
+SIZE_CACHE = '.size-cache.json'
+
+# Sizes as formatted by flatpak (with g_format_size), e.g. '12.5 MB'
+SIZE_REGEX = re.compile(r'^([0-9.]+)\s*(bytes|kB|MB|GB|TB)$')
+SIZE_UNITS = {'bytes': 1, 'kB': 1000, 'MB': 1000 ** 2, 'GB': 1000 ** 3,
+              'TB': 1000 ** 4}
+
+def parse_size(text):
+    """Return the number of bytes of a formatted size, or None"""
+    match = SIZE_REGEX.match(text.strip())
+    if not match:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+# Return the installed size of an entry listed by flatpak remote-ls -d,
+# whose tab-separated columns are the ref, the commit, the installed
+# size and the download size, or None if not listed
+def get_remote_size(entry):
+    columns = entry.split('\t')
+    if len(columns) < 3:
+        return None
+    return parse_size(columns[2])
+
+# Return the total size of the files in a directory tree, counting the
+# files hard linked from the OSTree repository only once
+def get_tree_size(path):
+    size = 0
+    seen = set()
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames:
+            stat = os.lstat(os.path.join(dirpath, name))
+            inode = (stat.st_dev, stat.st_ino)
+            if inode not in seen:
+                seen.add(inode)
+                size += stat.st_size
+    return size
+
+class SizeIndex(object):
+    """Installed sizes of the flatpaks deployed on this machine
+
+    The active deployment of each app in flatpak_dirs is measured by
+    walking its directory tree. Since deployments never change, the
+    sizes are cached in cache_path by app ID and commit, so that only
+    new deployments are walked by later runs.
+    """
+
+    def __init__(self, flatpak_dirs=FLATPAK_DIRS, cache_path=SIZE_CACHE):
+        self._flatpak_dirs = flatpak_dirs
+        self._cache_path = cache_path
+        # Sizes by (app ID, flatpak arch, branch)
+        self._sizes = {}
+        self._scanned_archs = set()
+        self._cache = {}
+        if cache_path:
+            try:
+                with open(cache_path) as f:
+                    self._cache = json.load(f)
+            except (IOError, ValueError):
+                pass
+
+    def _save_cache(self):
+        tmp_path = '%s.%d.tmp' % (self._cache_path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._cache, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self._cache_path)
+        except IOError as err:
+            print('Could not cache the flatpak sizes: %s' % err,
+                  file=sys.stderr)
+
+    def scan(self, arch):
+        """Index the sizes of the apps deployed for the flatpak arch"""
+        if arch in self._scanned_archs:
+            return
+        self._scanned_archs.add(arch)
+        changed = False
+        for flatpak_dir in self._flatpak_dirs:
+            app_dir = os.path.join(flatpak_dir, 'app')
+            try:
+                app_ids = sorted(os.listdir(app_dir))
+            except OSError:
+                continue
+            for app_id in app_ids:
+                arch_dir = os.path.join(app_dir, app_id, arch)
+                try:
+                    branches = sorted(os.listdir(arch_dir))
+                except OSError:
+                    continue
+                for branch in branches:
+                    active = os.path.join(arch_dir, branch, 'active')
+                    if not os.path.isdir(active):
+                        continue
+                    commit = os.path.basename(os.path.realpath(active))
+                    key = '%s/%s' % (app_id, commit)
+                    if key not in self._cache:
+                        self._cache[key] = get_tree_size(active)
+                        changed = True
+                    self._sizes.setdefault((app_id, arch, branch),
+                                           self._cache[key])
+        if changed and self._cache_path:
+            self._save_cache()
+
+    def get(self, app_id, arch, branch):
+        """Return the size in bytes of a deployed app, or None"""
+        return self._sizes.get((app_id, arch, branch))
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+# Imaging backends used to convert the CMS image assets
+#
+# The backends take the contents of the source image rather than its path,
+# so that images can be converted straight from the CMS zip file.
+#
+# The ImageMagick backend runs the 'convert' command for every asset,
+# (sudo apt-get install imagemagick)
+# while the Pillow backend does the same work within the process
+# (sudo apt-get install python3-pil)
+#
+# Run this script with a list of images to check that both backends
+# produce equivalent output
+
+import io
+import os
+import subprocess
+import sys
+
+ICON_MASK = '/tmp/icon_mask.png'
+# The icon mask is a 60x60 square with radius 15 rounding
+# centered within the 64x64 asset
+# Note: 61,61 is the bottom-right coordinate, not the size
+# of the rounded rectangle
+ICON_SIZE = 64
+ICON_MASK_RECT = (2, 2, 61, 61)
+ICON_MASK_RADIUS = 15
+JPEG_QUALITY = 90
+
+class ImageMagickBackend(object):
+    """Convert images with the ImageMagick command line tools"""
+
+    name = 'imagemagick'
+
+    def __init__(self):
+        # Number of commands run by this instance
+        self.commands = 0
+
+    def _run(self, args, data=None):
+        self.commands += 1
+        return subprocess.run(args, input=data).returncode
+
+    def prepare(self):
+        """Create the icon mask for cropping with rounded corners"""
+        draw = 'roundrectangle %d,%d,%d,%d,%d,%d' % (ICON_MASK_RECT +
+                                                     (ICON_MASK_RADIUS,
+                                                      ICON_MASK_RADIUS))
+        return self._run(['convert', '-size',
+                          '%dx%d' % (ICON_SIZE, ICON_SIZE),
+                          'xc:none', '-draw', draw, ICON_MASK])
+
+    def _get_resize_args(self, size, crop):
+        if size is None:
+            return []
+        geometry = '%dx%d' % size
+        if not crop:
+            return ['-resize', geometry]
+        # In case the image is rectangular,
+        # first resize so that the smallest dimension fits,
+        # then crop from the center to exactly the given size
+        return ['-resize', geometry + '^',
+                '-gravity', 'center', '-crop', geometry + '+0+0']
+
+    # Run the ImageMagick 'convert' application from the command line,
+    # with specified JPEG quality and all metadata stripped
+    def convert(self, data, target, size=None, crop=False):
+        return self._run(['convert', '-'] +
+                         self._get_resize_args(size, crop) +
+                         ['-quality', str(JPEG_QUALITY), '-strip', target],
+                         data)
+
+    # Use ImageMagick to round the corners with the icon mask
+    def round_icon(self, data, target, size=None, crop=False):
+        return self._run(['convert', '-'] +
+                         self._get_resize_args(size, crop) +
+                         ['-matte', ICON_MASK,
+                          '-compose', 'DstIn', '-composite', '-strip',
+                          '-define', 'png:exclude-chunks=date,time',
+                          target], data)
+
+class PillowBackend(object):
+    """Convert images in-process with Pillow"""
+
+    name = 'pillow'
+
+    # Scale factor used to anti-alias the rounded corners of the icon mask
+    MASK_SUPERSAMPLING = 4
+
+    def __init__(self):
+        # Import here so that Pillow is only required when it is used
+        from PIL import Image, ImageChops, ImageDraw
+        self._image = Image
+        self._image_chops = ImageChops
+        self._image_draw = ImageDraw
+        self._mask = None
+        # Everything is done in-process, so no commands are ever run
+        self.commands = 0
+
+    def prepare(self):
+        return 0
+
+    def _get_mask(self):
+        if self._mask is None:
+            # Draw the mask at a larger scale and then shrink it, since
+            # Pillow does not anti-alias the shapes it draws. Each pixel
+            # coordinate of the rectangle is the center of a pixel, so
+            # the drawn area extends half a pixel beyond them.
+            scale = self.MASK_SUPERSAMPLING
+            left, top, right, bottom = ICON_MASK_RECT
+            mask = self._image.new('L', (ICON_SIZE * scale,
+                                         ICON_SIZE * scale), 0)
+            draw = self._image_draw.Draw(mask)
+            draw.rounded_rectangle(
+                [int((left - 0.5) * scale), int((top - 0.5) * scale),
+                 int((right + 0.5) * scale) - 1,
+                 int((bottom + 0.5) * scale) - 1],
+                radius=ICON_MASK_RADIUS * scale, fill=255)
+            self._mask = mask.resize((ICON_SIZE, ICON_SIZE),
+                                     self._image.BOX)
+        return self._mask
+
+    def _resize(self, image, size, crop):
+        if size is None:
+            return image
+        width, height = size
+        if crop:
+            scale = max(width / image.width, height / image.height)
+        else:
+            scale = min(width / image.width, height / image.height)
+        resized = image.resize((max(1, round(image.width * scale)),
+                                max(1, round(image.height * scale))),
+                               self._image.LANCZOS)
+        if not crop:
+            return resized
+        left = (resized.width - width) // 2
+        top = (resized.height - height) // 2
+        return resized.crop((left, top, left + width, top + height))
+
+    # Save the image with all its metadata stripped, as with the
+    # ImageMagick -strip option. Pillow only writes the pixel data and
+    # the metadata it is given, except for the color profile and Exif
+    # data, which it carries over from the source image unless cleared.
+    def _save(self, image, target):
+        metadata = {'icc_profile': None, 'exif': b''}
+        if target.endswith(('.jpg', '.jpeg')):
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            # Match ImageMagick, which only subsamples chroma
+            # for qualities below 90
+            if JPEG_QUALITY >= 90:
+                subsampling = 0
+            else:
+                subsampling = 2
+            image.save(target, 'JPEG', quality=JPEG_QUALITY,
+                       subsampling=subsampling, **metadata)
+        else:
+            image.save(target, **metadata)
+
+    def convert(self, data, target, size=None, crop=False):
+        with self._image.open(io.BytesIO(data)) as image:
+            image.load()
+            if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                image = image.convert('RGBA')
+            self._save(self._resize(image, size, crop), target)
+        return 0
+
+    # Round the corners by keeping the image only where the mask
+    # is opaque, as with the ImageMagick DstIn composition
+    def round_icon(self, data, target, size=None, crop=False):
+        with self._image.open(io.BytesIO(data)) as image:
+            image = self._resize(image.convert('RGBA'), size, crop)
+        # Areas not covered by the mask are cleared, and the mask is
+        # centered when cropping, as ImageMagick uses the crop gravity
+        mask = self._image.new('L', image.size, 0)
+        if crop:
+            offset = ((image.width - ICON_SIZE) // 2,
+                      (image.height - ICON_SIZE) // 2)
+        else:
+            offset = (0, 0)
+        mask.paste(self._get_mask(), offset)
+        alpha = self._image_chops.multiply(image.getchannel('A'), mask)
+        image.putalpha(alpha)
+        self._save(image, target)
+        return 0
+
+BACKENDS = {
+    ImageMagickBackend.name: ImageMagickBackend,
+    PillowBackend.name: PillowBackend
+}
+
+_backends = {}
+
+def get_backend(name):
+    """Return the shared instance of the named backend"""
+    if name not in _backends:
+        _backends[name] = BACKENDS[name]()
+    return _backends[name]
+
+# ImageMagick produced the committed assets, so it stays the default to
+# keep the output stable, while Pillow has to be chosen explicitly
+DEFAULT_BACKEND = ImageMagickBackend.name
+
+# The operations used by unzip_content.py, as (method, target extension,
+# size, crop), which should give equivalent output with both backends
+OPERATIONS = [
+    ('convert', '.jpg', None, False),
+    ('convert', '.jpg', (480, 480), False),
+    ('convert', '.jpg', (90, 90), True),
+    ('round_icon', '.png', None, False),
+    ('round_icon', '.png', (ICON_SIZE, ICON_SIZE), True)
+]
+
+# Tolerance of compare_images for the output of both backends to be
+# considered equivalent
+PARITY_TOLERANCE = 3.0
+
+# Return the mean absolute difference per channel, from 0 to 255,
+# between two images of the same size
+def compare_images(path_a, path_b):
+    from PIL import Image, ImageChops, ImageStat
+    with Image.open(path_a) as image_a, Image.open(path_b) as image_b:
+        if image_a.size != image_b.size:
+            return None
+        mode = 'RGBA' if path_a.endswith('.png') else 'RGB'
+        diff = ImageChops.difference(image_a.convert(mode),
+                                     image_b.convert(mode))
+        return sum(ImageStat.Stat(diff).mean) / len(mode)
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    import tempfile
+
+    parser = ArgumentParser(
+        description='Compare the output of the ImageMagick and Pillow backends')
+    parser.add_argument('images', nargs='+', help='source images to convert')
+    parser.add_argument('--tolerance', type=float, default=PARITY_TOLERANCE,
+                        help='maximum mean difference per channel ' +
+                        '(default: %(default)s)')
+    args = parser.parse_args()
+
+    backends = [get_backend(name) for name in sorted(BACKENDS)]
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for backend in backends:
+            if backend.prepare() != 0:
+                sys.exit('Could not prepare the %s backend' % backend.name)
+        for source in args.images:
+            with open(source, 'rb') as source_file:
+                data = source_file.read()
+            for method, ext, size, crop in OPERATIONS:
+                targets = []
+                for backend in backends:
+                    target = os.path.join(tmp_dir, backend.name + ext)
+                    getattr(backend, method)(data, target, size, crop)
+                    targets.append(target)
+                diff = compare_images(*targets)
+                ok = diff is not None and diff <= args.tolerance
+                if not ok:
+                    failures += 1
+                if diff is None:
+                    result = 'size mismatch'
+                else:
+                    result = 'difference %.2f' % diff
+                print('%s: %s %s size=%s crop=%s: %s' % (
+                    'OK' if ok else 'FAIL', source, method, size, crop,
+                    result))
+    if failures:
+        sys.exit('%d conversions differ between the backends' % failures)
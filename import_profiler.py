@@ -0,0 +1,207 @@
+# Instrumentation of the phases of the content import
+#
+# An ImportProfiler is passed as the phase hook of ContentImporter.run,
+# and records for each phase:
+# - the wall clock time
+# - the CPU time of this process, and of the child processes that
+#   finished during the phase (such as the worker pools and the commands
+#   they ran)
+# - the number of processes started, i.e. the processes forked by this
+#   one (such as the workers of the pools) and the commands run by the
+#   imaging backend
+# - the bytes read and written, both by this process and by the workers
+#   converting the assets
+#
+# It also keeps the time taken by each asset conversion, to report the
+# slowest ones, and can profile the phases with cProfile and record them
+# as a trace for the Chrome trace viewer (chrome://tracing or Perfetto).
+
+import collections
+import cProfile
+import json
+import os
+import resource
+import time
+
+from asset_converter import describe_source
+
+# Processes forked by this process since it started, including the ones
+# started by multiprocessing, which counts as long as it forks its workers
+_forks = 0
+
+def _count_fork():
+    global _forks
+    _forks += 1
+
+os.register_at_fork(after_in_parent=_count_fork)
+
+# Return the bytes passed to read() and write() calls by this process,
+# which are only available on Linux
+def _get_io_counters():
+    counters = {}
+    try:
+        with open('/proc/self/io') as io_file:
+            for line in io_file:
+                name, value = line.split(':')
+                counters[name] = int(value)
+    except OSError:
+        pass
+    return counters.get('rchar', 0), counters.get('wchar', 0)
+
+def _get_cpu_times():
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (usage_self.ru_utime + usage_self.ru_stime,
+            usage_children.ru_utime + usage_children.ru_stime)
+
+PhaseStats = collections.namedtuple('PhaseStats', [
+    'name', 'start', 'wall', 'cpu', 'children_cpu', 'processes',
+    'bytes_read', 'bytes_written', 'assets'
+])
+
+class _Counters(object):
+    """Snapshot of the counters of this process and of the converter"""
+
+    def __init__(self, converter):
+        self.time = time.perf_counter()
+        self.cpu, self.children_cpu = _get_cpu_times()
+        self.bytes_read, self.bytes_written = _get_io_counters()
+        self.processes = _forks
+        if converter:
+            self.bytes_read += converter.bytes_read
+            self.bytes_written += converter.bytes_written
+            self.processes += converter.commands
+            self.assets = len(converter.results)
+        else:
+            self.assets = 0
+
+class ImportProfiler(object):
+    """Phase hook of ContentImporter.run that profiles each phase
+
+    The statistics of the asset conversions are those of converter,
+    the ConversionQueue used by the import. If cprofile is set,
+    the phases are also profiled with cProfile.
+    """
+
+    def __init__(self, converter=None, cprofile=False):
+        self._converter = converter
+        self._start = time.perf_counter()
+        self.phases = []
+        if cprofile:
+            self._profile = cProfile.Profile()
+        else:
+            self._profile = None
+
+    def __call__(self, phase):
+        return _PhaseContext(self, phase)
+
+    def _begin(self):
+        counters = _Counters(self._converter)
+        if self._profile:
+            self._profile.enable()
+        return counters
+
+    def _end(self, phase, before):
+        if self._profile:
+            self._profile.disable()
+        after = _Counters(self._converter)
+        self.phases.append(PhaseStats(
+            phase, before.time, after.time - before.time,
+            after.cpu - before.cpu, after.children_cpu - before.children_cpu,
+            after.processes - before.processes,
+            after.bytes_read - before.bytes_read,
+            after.bytes_written - before.bytes_written,
+            after.assets - before.assets))
+
+    def get_slowest_assets(self, count):
+        if not self._converter:
+            return []
+        return sorted(self._converter.results,
+                      key=lambda result: result.elapsed,
+                      reverse=True)[:count]
+
+    def print_report(self, slowest=10):
+        print('%-12s %9s %9s %9s %9s %7s %11s %13s' % (
+            'Phase', 'Wall (s)', 'CPU (s)', 'Child CPU', 'Processes',
+            'Assets', 'Read (KiB)', 'Written (KiB)'))
+        totals = [sum(getattr(stats, field) for stats in self.phases)
+                  for field in PhaseStats._fields[2:]]
+        rows = self.phases + [PhaseStats('total', self._start, *totals)]
+        for stats in rows:
+            print('%-12s %9.3f %9.3f %9.3f %9d %7d %11.0f %13.0f' % (
+                stats.name, stats.wall, stats.cpu, stats.children_cpu,
+                stats.processes, stats.assets, stats.bytes_read / 1024,
+                stats.bytes_written / 1024))
+
+        results = self.get_slowest_assets(slowest)
+        if results:
+            print('Slowest %d assets:' % len(results))
+            for result in results:
+                print('%8.3fs %s -> %s%s' % (
+                    result.elapsed, describe_source(result.source),
+                    result.target, ' (cached)' if result.cached else ''))
+
+    def write_cprofile(self, path):
+        """Write the cProfile statistics, for use with the pstats module"""
+        self._profile.dump_stats(path)
+
+    def write_trace(self, path):
+        """Write the phases and the asset conversions in the Chrome
+        trace event format
+        """
+        # Timestamps are in microseconds since the profiler was created
+        def get_timestamp(start):
+            return round((start - self._start) * 1000000)
+
+        pid = os.getpid()
+        events = [{
+            'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': pid,
+            'args': {'name': 'unzip_content.py'}
+        }]
+        for stats in self.phases:
+            events.append({
+                'name': stats.name, 'cat': 'phase', 'ph': 'X',
+                'pid': pid, 'tid': pid,
+                'ts': get_timestamp(stats.start),
+                'dur': round(stats.wall * 1000000),
+                'args': {
+                    'cpu': stats.cpu, 'children_cpu': stats.children_cpu,
+                    'processes': stats.processes, 'assets': stats.assets,
+                    'bytes_read': stats.bytes_read,
+                    'bytes_written': stats.bytes_written
+                }
+            })
+        if self._converter:
+            # Show each worker as a thread of this process,
+            # since they only exist for the duration of a phase
+            for result in self._converter.results:
+                events.append({
+                    'name': os.path.basename(result.target),
+                    'cat': 'asset', 'ph': 'X', 'pid': pid,
+                    'tid': result.pid,
+                    'ts': get_timestamp(result.start),
+                    'dur': round(result.elapsed * 1000000),
+                    'args': {
+                        'source': describe_source(result.source),
+                        'target': result.target, 'status': result.status,
+                        'cached': result.cached,
+                        'bytes_read': result.bytes_read,
+                        'bytes_written': result.bytes_written
+                    }
+                })
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'},
+                      trace_file)
+
+class _PhaseContext(object):
+
+    def __init__(self, profiler, phase):
+        self._profiler = profiler
+        self._phase = phase
+
+    def __enter__(self):
+        self._before = self._profiler._begin()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._profiler._end(self._phase, self._before)
+        return False
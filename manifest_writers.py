@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+# Bundle manifests generated from the desktop objects of the content import
+#
+# The apps are indexed by personality, core flag and category in a single
+# pass over the desktop objects, and each manifest format is then written
+# from the index by its own writer, so that formats can be added without
+# going over the apps again.
+#
+# The text manifests are the ones used to maintain the image builder
+# manifests in eos-obs-build and the core list in eos-meta, while the
+# JSON manifest has the same lists in a single file for other tools.
+
+import json
+import os
+
+from desktop_object import AppObject
+
+class ManifestIndex(object):
+    """Index of the app bundles by personality, core flag and category"""
+
+    def __init__(self, desktop_objects, personalities):
+        self.personalities = personalities
+        self.bundles = []
+        self.core = []
+        self.categories = {}
+        # Bundles for all personalities, and for each specific personality
+        self._all_personalities = set()
+        self._by_personality = {}
+
+        for id, obj in desktop_objects.items():
+            if not isinstance(obj, AppObject):
+                continue
+            if obj.get('Core'):
+                self.core.append(id)
+            else:
+                self.bundles.append(id)
+                for personality in obj.get('Personalities'):
+                    if personality == 'All':
+                        self._all_personalities.add(id)
+                    else:
+                        self._by_personality.setdefault(personality,
+                                                        set()).add(id)
+            categories = obj.get('Categories')
+            # Drop the terminal ';' from the category list
+            categories = categories[:len(categories)-1]
+            for category in categories.split(';'):
+                self.categories.setdefault(category, []).append(id)
+
+        self.bundles.sort()
+        self.core.sort()
+        for app_ids in self.categories.values():
+            app_ids.sort()
+
+    def get_personality_bundles(self, personality):
+        """Get the sorted app bundles of a personality
+
+        The default personality has no bundles, while 'all' has all of them.
+        """
+        if personality == 'default':
+            return []
+        if personality == 'all':
+            return self.bundles
+        return sorted(self._all_personalities |
+                      self._by_personality.get(personality, set()))
+
+class TextManifestWriter(object):
+    """Write one text manifest per personality, plus the core apps
+    and the apps of each category
+    """
+
+    name = 'txt'
+
+    def write(self, index, manifests_dir):
+        # For each personality, write a manifest of all the app bundles
+        # (useful in maintaining the image builder manifests in eos-obs-build)
+        for personality in index.personalities + ['all']:
+            self._write_list(os.path.join(manifests_dir,
+                                          'bundle-manifest-%s.txt' %
+                                          personality),
+                             index.get_personality_bundles(personality))
+
+        # Generate a manifest of all the core apps
+        # (useful in maintaining the core list in eos-meta)
+        self._write_list(os.path.join(manifests_dir, 'core-manifest.txt'),
+                         index.core)
+
+        # Generate a manifest of all the apps by category
+        categories_path = os.path.join(manifests_dir, 'categories.txt')
+        with open(categories_path, 'w') as categories_file:
+            for category in sorted(index.categories.keys()):
+                categories_file.write(category + ':\n')
+                for app in index.categories[category]:
+                    categories_file.write(app + '\n')
+                categories_file.write('\n')
+
+    def _write_list(self, path, app_ids):
+        with open(path, 'w') as manifest_file:
+            for app in app_ids:
+                manifest_file.write(app + '\n')
+
+class JsonManifestWriter(object):
+    """Write all the manifests as a single JSON file"""
+
+    name = 'json'
+
+    def write(self, index, manifests_dir):
+        personalities = {}
+        for personality in index.personalities + ['all']:
+            personalities[personality] = \
+                index.get_personality_bundles(personality)
+        json_data = {
+            'personalities': personalities,
+            'core': index.core,
+            'categories': index.categories
+        }
+        with open(os.path.join(manifests_dir, 'manifests.json'), 'w') \
+                as manifest_file:
+            json.dump(json_data, manifest_file, indent=2, sort_keys=True)
+            manifest_file.write('\n')
+
+MANIFEST_WRITERS = {
+    TextManifestWriter.name: TextManifestWriter,
+    JsonManifestWriter.name: JsonManifestWriter
+}
+
+DEFAULT_MANIFEST_FORMATS = [TextManifestWriter.name]
+
+def write_manifests(desktop_objects, personalities, manifests_dir,
+                    formats=DEFAULT_MANIFEST_FORMATS):
+    """Index the desktop objects once and write the manifests
+    in each of the given formats
+    """
+    index = ManifestIndex(desktop_objects, personalities)
+    for name in formats:
+        MANIFEST_WRITERS[name]().write(index, manifests_dir)
+    return index
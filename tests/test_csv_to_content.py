@@ -0,0 +1,128 @@
+# Tests of the sync of the content with the spreadsheet
+
+import contextlib
+import io
+import json
+import os
+import sys
+import unittest
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+sys.path.insert(0, os.path.join(TOP_DIR, 'tools'))
+
+from eoscontentindex import ContentIndex
+
+try:
+    import polib
+except ImportError:
+    polib = None
+
+if polib:
+    from catalog_index import CatalogIndex, load_catalogs
+    from csv_to_content import ContentSync
+
+DATA_DIR = os.path.join(TOP_DIR, 'tests', 'data', 'csv_to_content')
+
+@unittest.skipIf(polib is None, 'polib is not installed')
+class CatalogIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = load_catalogs(DATA_DIR, ['es'])['es']
+
+    def test_exact_context(self):
+        self.assertEqual(self.catalog.find('Maps', 'title').msgctxt, 'title')
+        self.assertEqual(self.catalog.find('Maps', 'subtitle').msgctxt,
+                         'subtitle')
+
+    def test_fallback_to_first_msgid(self):
+        # As polib's find(), which ignores the context
+        entry = self.catalog.find('Maps', 'description')
+        self.assertIs(entry, self.catalog.po.find('Maps'))
+        self.assertEqual(entry.msgctxt, 'title')
+        self.assertIs(self.catalog.find('Maps'), entry)
+
+    def test_obsolete_entries_are_ignored(self):
+        entry = self.catalog.find('An atlas', 'description')
+        self.assertFalse(entry.obsolete)
+        self.assertEqual(entry.msgctxt, 'title')
+
+    def test_missing(self):
+        self.assertIsNone(self.catalog.find('Atlas', 'title'))
+
+    def test_append(self):
+        entry = polib.POEntry(msgid='Atlas', msgstr='Atlas', msgctxt='title')
+        self.catalog.append(entry)
+        self.assertIs(self.catalog.find('Atlas', 'title'), entry)
+        self.assertIn(entry, self.catalog.po)
+
+@unittest.skipIf(polib is None, 'polib is not installed')
+class ContentSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(DATA_DIR, 'content.json')) as content_file:
+            self.apps = json.load(content_file)
+        self.catalogs = load_catalogs(DATA_DIR, ['es', 'pt_BR'])
+        self.sync = ContentSync(ContentIndex(self.apps), self.catalogs)
+        with open(os.path.join(DATA_DIR, 'content.csv'), newline='') \
+                as csv_file, contextlib.redirect_stdout(io.StringIO()):
+            self.sync.sync(csv_file)
+
+    def get_msgstr(self, lang, msgid, msgctxt):
+        for entry in self.catalogs[lang].po:
+            if entry.msgid == msgid and entry.msgctxt == msgctxt and \
+                    not entry.obsolete:
+                return entry.msgstr
+        return None
+
+    def test_apps(self):
+        self.assertEqual(self.sync.diff['apps'], {
+            'org.example.Maps': {
+                'description': ['Browse maps', 'Browse the maps']
+            }
+        })
+        self.assertEqual(self.apps[1]['description'], 'Browse the maps')
+
+    def test_warnings(self):
+        self.assertEqual(self.sync.diff['warnings'], [
+            'app id org.example.Missing not found in content.json',
+            'no app id specified for No ID'
+        ])
+
+    def test_changed_langs(self):
+        self.assertEqual(self.sync.get_changed_langs(), ['es'])
+
+    def test_translation_of_context(self):
+        # The same English string as a subtitle only updates
+        # the entry of the subtitle context
+        self.assertEqual(self.get_msgstr('es', 'Maps', 'subtitle'),
+                         'Mapas del mundo')
+        self.assertEqual(self.get_msgstr('es', 'Maps', 'title'), 'Mapas')
+
+    def test_translation_fallback(self):
+        # Without an entry for the context, the first entry with the same
+        # string is updated, rather than a new one added
+        self.assertEqual(self.get_msgstr('es', 'An atlas', 'title'),
+                         'Un atlas')
+        self.assertIsNone(self.get_msgstr('es', 'An atlas', 'description'))
+
+    def test_translation_diff(self):
+        changes = self.sync.diff['translations']['es']
+        self.assertEqual(changes['changed'], [
+            {'msgid': 'Find your way', 'msgctxt': 'subtitle',
+             'old': 'Encuentra', 'new': 'Encuentra tu camino'},
+            {'msgid': 'Maps', 'msgctxt': 'subtitle',
+             'old': 'Mapas', 'new': 'Mapas del mundo'},
+            {'msgid': 'An atlas', 'msgctxt': 'description',
+             'old': 'Atlas antiguo', 'new': 'Un atlas'}
+        ])
+        self.assertEqual(changes['added'], [
+            {'msgid': 'Browse the maps', 'msgctxt': 'description',
+             'new': 'Explora los mapas'},
+            {'msgid': 'Atlas', 'msgctxt': 'title', 'new': 'Atlas'}
+        ])
+        self.assertEqual(self.sync.diff['translations']['pt_BR'],
+                         {'changed': [], 'added': []})
+
+if __name__ == '__main__':
+    unittest.main()
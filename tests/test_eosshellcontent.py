@@ -0,0 +1,183 @@
+# Tests of the merge of the content into appdata files
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(TOP_DIR, 'tools'))
+
+import eosshellcontent
+
+try:
+    import polib
+except ImportError:
+    polib = None
+
+CONTENT = [{
+    'application-id': 'org.example.Foo',
+    'title': 'Foo',
+    'subtitle': 'Does foo',
+    'description': 'Foo is <em>great</em>',
+    'category': 'Education;Games;',
+    'screenshots': {'C': ['foo-1.jpg', 'foo-2.png'], 'de': ['foo-1.jpg']}
+}]
+
+TRANSLATIONS = {
+    'de': [('title', 'Foo', 'Fuu'),
+           ('subtitle', 'Does foo', 'Macht foo'),
+           ('description', 'Foo is <em>great</em>', 'Fuu ist <em>toll</em>')],
+    'fr': [('title', 'Foo', 'Fou')],
+    # Not used, since the title is not translated
+    'es': [('subtitle', 'Does foo', 'Hace foo'),
+           (None, 'Foo', 'Fu')]
+}
+
+APPDATA = '''<?xml version="1.0" encoding="UTF-8"?>
+<component type="desktop">
+  <id>org.example.Foo.desktop</id>
+  <name>Upstream Foo</name>
+  <name xml:lang="pt">Foo em portugues</name>
+  <summary>Upstream summary</summary>
+  <description>
+    <p>Upstream description</p>
+    <p xml:lang="pt">Um <em>bom</em> jogo</p>
+    <ul>
+      <li>one</li>
+      <li xml:lang="pt">um <code>dois</code> tres</li>
+    </ul>
+  </description>
+  <screenshots>
+    <screenshot type="default">
+      <image>https://example.org/foo.png</image>
+    </screenshot>
+  </screenshots>
+</component>
+'''
+
+@unittest.skipIf(polib is None, 'polib is not installed')
+class MergeAppdataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+        locales_dir = os.path.join(self.tmp_dir, 'locale')
+        for lang, messages in TRANSLATIONS.items():
+            po = polib.POFile()
+            po.metadata = {'Content-Type': 'text/plain; charset=UTF-8'}
+            for msgctxt, msgid, msgstr in messages:
+                po.append(polib.POEntry(msgctxt=msgctxt, msgid=msgid,
+                                        msgstr=msgstr))
+            mo_dir = os.path.join(locales_dir, lang, 'LC_MESSAGES')
+            os.makedirs(mo_dir)
+            po.save_as_mofile(os.path.join(mo_dir,
+                                           eosshellcontent.MO_FILE_NAME))
+
+        content_json = os.path.join(self.tmp_dir, 'content.json')
+        with open(content_json, 'w') as content_file:
+            json.dump(CONTENT, content_file)
+
+        for name, value in [('LOCALES_DIR', locales_dir),
+                            ('EOS_CONTENT_JSON', content_json)]:
+            patcher = mock.patch.object(eosshellcontent, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.appdata = os.path.join(self.tmp_dir, 'foo.appdata.xml')
+        with open(self.appdata, 'w') as appdata_file:
+            appdata_file.write(APPDATA)
+
+    def merge(self, indexed=False):
+        shell_content = eosshellcontent.ShellContent()
+        if indexed:
+            shell_content.index_translations()
+        return shell_content.update_appdata_from_file(self.appdata)
+
+    def test_indexed_translations(self):
+        # No message is looked up in the catalogs once they are indexed
+        with mock.patch.object(eosshellcontent.MoCatalog, 'get',
+                               side_effect=AssertionError('Looked up')):
+            xml = self.merge(indexed=True)
+        self.assertEqual(xml, self.merge())
+        self.assertIn('<name xml:lang="de">Fuu</name>', xml)
+        self.assertIn('<summary xml:lang="de">Macht foo</summary>', xml)
+        self.assertIn('<name xml:lang="fr">Fou</name>', xml)
+        self.assertNotIn('xml:lang="es"', xml)
+
+    def test_merge_is_idempotent(self):
+        xml = self.merge()
+        with open(self.appdata, 'w') as appdata_file:
+            appdata_file.write(xml)
+        self.assertEqual(self.merge(), xml)
+
+    def test_third_party_screenshots_are_removed(self):
+        xml = self.merge()
+        self.assertNotIn('https://example.org/foo.png', xml)
+        self.assertIn(eosshellcontent.CMS_GS_BUCKET_URL +
+                      '/screenshots/org.example.Foo/de/foo-1.jpg', xml)
+
+    def test_inline_markup_is_not_indented(self):
+        xml = self.merge()
+        self.assertIn('<p>Foo is <em>great</em></p>', xml)
+        self.assertIn('<p xml:lang="de">Fuu ist <em>toll</em></p>', xml)
+        self.assertIn('<p xml:lang="pt">Um <em>bom</em> jogo</p>', xml)
+        self.assertIn('<li xml:lang="pt">um <code>dois</code> tres</li>', xml)
+
+@unittest.skipIf(polib is None, 'polib is not installed')
+class MoCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def compile(self, po):
+        mo_file = os.path.join(self.tmp_dir, 'messages.mo')
+        po.save_as_mofile(mo_file)
+        # The messages that are expected to be found in the catalog
+        expected = {}
+        for entry in po.translated_entries():
+            if entry.msgid and not entry.msgid_plural:
+                expected[(entry.msgid, entry.msgctxt)] = entry.msgstr
+        return mo_file, expected
+
+    def check_catalog(self, po):
+        mo_file, expected = self.compile(po)
+        self.assertTrue(expected)
+        catalog = eosshellcontent.MoCatalog(mo_file)
+        for key, msgstr in expected.items():
+            self.assertEqual(catalog.get(key), msgstr)
+        self.assertIsNone(catalog.get(('Not translated', None)))
+        self.assertEqual(catalog.get(('Not translated', 'title'), ''), '')
+        self.assertEqual(dict(catalog.items()), expected)
+        return catalog
+
+    def test_messages(self):
+        po = polib.POFile()
+        po.metadata = {'Content-Type': 'text/plain; charset=UTF-8'}
+        po.append(polib.POEntry(msgid='Maps', msgstr='Mapas'))
+        po.append(polib.POEntry(msgctxt='title', msgid='Maps',
+                                msgstr='Mapas (título)'))
+        po.append(polib.POEntry(msgctxt='subtitle', msgid='Maps',
+                                msgstr='Mapas (subtítulo)'))
+        po.append(polib.POEntry(msgid='\u2603 snow', msgstr='\u2603 neve'))
+        po.append(polib.POEntry(msgid='Untranslated', msgstr=''))
+        po.append(polib.POEntry(msgid='%d app', msgid_plural='%d apps',
+                                msgstr_plural={0: '%d app', 1: '%d apps'}))
+        catalog = self.check_catalog(po)
+        self.assertEqual(catalog.get(('Maps', 'subtitle')), 'Mapas (subtítulo)')
+        self.assertIsNone(catalog.get(('Untranslated', None)))
+        self.assertIsNone(catalog.get(('%d app', None)))
+
+    def test_catalogs_of_the_tree(self):
+        for lang in ['es', 'pt_BR', 'zh_CN']:
+            with self.subTest(lang=lang):
+                self.check_catalog(polib.pofile(
+                    os.path.join(TOP_DIR, 'po', lang + '.po')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# Tests of the flatpak sizes of the app reports
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+
+import flatpak_sizes
+from flatpak_sizes import SizeIndex, get_remote_size, parse_size
+
+class ParseSizeTest(unittest.TestCase):
+
+    def test_units(self):
+        self.assertEqual(parse_size('512 bytes'), 512)
+        self.assertEqual(parse_size('1.5 kB'), 1500)
+        self.assertEqual(parse_size('12.5 MB'), 12500000)
+        self.assertEqual(parse_size('2 GB'), 2000000000)
+        self.assertEqual(parse_size('1.1 TB'), 1100000000000)
+
+    def test_spacing(self):
+        # Recent versions of GLib separate the unit with a no-break space
+        self.assertEqual(parse_size('12.5\u00a0MB'), 12500000)
+        self.assertEqual(parse_size(' 12.5MB\n'), 12500000)
+
+    def test_invalid(self):
+        for text in ['', 'MB', '12.5', '12.5 MiB', 'unknown', '-1 MB']:
+            with self.subTest(text=text):
+                self.assertIsNone(parse_size(text))
+
+class RemoteSizeTest(unittest.TestCase):
+
+    def test_listed(self):
+        entry = 'app/org.gnome.Maps/x86_64/eos3\t0123abcd\t12.5 MB\t4.1 MB'
+        self.assertEqual(get_remote_size(entry), 12500000)
+
+    def test_not_listed(self):
+        self.assertIsNone(get_remote_size('app/org.gnome.Maps/x86_64/eos3'))
+        self.assertIsNone(get_remote_size(
+            'app/org.gnome.Maps/x86_64/eos3\t0123abcd'))
+        self.assertIsNone(get_remote_size(
+            'app/org.gnome.Maps/x86_64/eos3\t0123abcd\t?\t4.1 MB'))
+
+class SizeIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.flatpak_dir = os.path.join(self.tmp_dir, 'flatpak')
+        self.cache_path = os.path.join(self.tmp_dir, 'sizes.json')
+
+    # Deploy a fake app with the given file sizes, returning its files dir
+    def deploy(self, app_id, branch, commit, sizes, arch='x86_64'):
+        branch_dir = os.path.join(self.flatpak_dir, 'app', app_id, arch,
+                                  branch)
+        files_dir = os.path.join(branch_dir, commit, 'files')
+        os.makedirs(files_dir)
+        for i, size in enumerate(sizes):
+            with open(os.path.join(files_dir, 'file%d' % i), 'wb') as f:
+                f.write(b'\0' * size)
+        active = os.path.join(branch_dir, 'active')
+        if os.path.lexists(active):
+            os.remove(active)
+        os.symlink(commit, active)
+        return files_dir
+
+    def get_index(self, arch='x86_64'):
+        size_index = SizeIndex([self.flatpak_dir], self.cache_path)
+        size_index.scan(arch)
+        return size_index
+
+    def test_sizes(self):
+        self.deploy('org.gnome.Maps', 'eos3', 'aaaa', [100, 200])
+        self.deploy('org.gnome.Maps', 'stable', 'bbbb', [50])
+        self.deploy('org.gnome.Maps', 'eos3', 'cccc', [1000], arch='arm')
+        size_index = self.get_index()
+        self.assertEqual(size_index.get('org.gnome.Maps', 'x86_64', 'eos3'),
+                         300)
+        self.assertEqual(size_index.get('org.gnome.Maps', 'x86_64', 'stable'),
+                         50)
+        self.assertIsNone(size_index.get('org.gnome.Maps', 'arm', 'eos3'))
+        self.assertIsNone(size_index.get('org.gnome.Totem', 'x86_64',
+                                         'eos3'))
+
+    def test_hard_links_are_counted_once(self):
+        files_dir = self.deploy('org.gnome.Maps', 'eos3', 'aaaa', [100])
+        os.link(os.path.join(files_dir, 'file0'),
+                os.path.join(files_dir, 'link'))
+        size_index = self.get_index()
+        self.assertEqual(size_index.get('org.gnome.Maps', 'x86_64', 'eos3'),
+                         100)
+
+    def test_cached_sizes_are_reused(self):
+        self.deploy('org.gnome.Maps', 'eos3', 'aaaa', [100])
+        self.get_index()
+        with open(self.cache_path) as f:
+            self.assertEqual(json.load(f), {'org.gnome.Maps/aaaa': 100})
+        with mock.patch.object(flatpak_sizes, 'get_tree_size',
+                               side_effect=AssertionError('Walked again')):
+            size_index = self.get_index()
+        self.assertEqual(size_index.get('org.gnome.Maps', 'x86_64', 'eos3'),
+                         100)
+
+    def test_new_commit_is_measured(self):
+        self.deploy('org.gnome.Maps', 'eos3', 'aaaa', [100])
+        self.get_index()
+        self.deploy('org.gnome.Maps', 'eos3', 'bbbb', [300])
+        size_index = self.get_index()
+        self.assertEqual(size_index.get('org.gnome.Maps', 'x86_64', 'eos3'),
+                         300)
+
+    def test_no_cache(self):
+        self.deploy('org.gnome.Maps', 'eos3', 'aaaa', [100])
+        size_index = SizeIndex([self.flatpak_dir], None)
+        size_index.scan('x86_64')
+        self.assertEqual(size_index.get('org.gnome.Maps', 'x86_64', 'eos3'),
+                         100)
+        self.assertFalse(os.path.exists(self.cache_path))
+
+    def test_missing_installation(self):
+        size_index = self.get_index()
+        self.assertIsNone(size_index.get('org.gnome.Maps', 'x86_64', 'eos3'))
+
+if __name__ == '__main__':
+    unittest.main()
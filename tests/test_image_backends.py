@@ -0,0 +1,109 @@
+# Check that the ImageMagick and Pillow backends give equivalent output
+# for the operations used by unzip_content.py
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+
+from image_backends import (BACKENDS, OPERATIONS, PARITY_TOLERANCE,
+                            compare_images, get_backend)
+
+try:
+    from PIL import Image, ImageCms
+except ImportError:
+    Image = None
+
+# Generate a source image with smooth areas and sharp edges,
+# in the given format and with the given metadata
+def make_image(fmt, size=(320, 200), **metadata):
+    image = Image.merge('RGB', [
+        Image.linear_gradient('L').resize(size),
+        Image.effect_mandelbrot(size, (-2.0, -1.2, 1.0, 1.2), 64),
+        Image.radial_gradient('L').resize(size)
+    ])
+    image_file = io.BytesIO()
+    image.save(image_file, fmt, **metadata)
+    return image_file.getvalue()
+
+def get_icc_profile():
+    return ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+
+# Convert data with all the operations of the backend, returning
+# the operation and path of each target
+def convert_all(backend, data, target_dir):
+    for method, ext, size, crop in OPERATIONS:
+        target = os.path.join(target_dir, backend.name + ext)
+        status = getattr(backend, method)(data, target, size, crop)
+        yield (method, size, crop), status, target
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+@unittest.skipIf(shutil.which('convert') is None,
+                 'ImageMagick is not installed')
+class BackendParityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backends = [get_backend(name) for name in sorted(BACKENDS)]
+        for backend in self.backends:
+            self.assertEqual(backend.prepare(), 0)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def check_parity(self, data):
+        for method, ext, size, crop in OPERATIONS:
+            with self.subTest(method=method, size=size, crop=crop):
+                targets = []
+                for backend in self.backends:
+                    target = os.path.join(self.tmp_dir, backend.name + ext)
+                    status = getattr(backend, method)(data, target, size,
+                                                      crop)
+                    self.assertEqual(status, 0)
+                    targets.append(target)
+                diff = compare_images(*targets)
+                self.assertIsNotNone(diff, 'sizes differ')
+                self.assertLessEqual(diff, PARITY_TOLERANCE)
+                for target in targets:
+                    with Image.open(target) as image:
+                        self.assertNotIn('icc_profile', image.info)
+
+    def test_jpeg(self):
+        self.check_parity(make_image('JPEG'))
+
+    def test_png(self):
+        self.check_parity(make_image('PNG'))
+
+    def test_icc_profile(self):
+        for fmt in ['JPEG', 'PNG']:
+            with self.subTest(fmt=fmt):
+                self.check_parity(make_image(fmt,
+                                             icc_profile=get_icc_profile()))
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class PillowMetadataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = get_backend('pillow')
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_metadata_is_stripped(self):
+        exif = Image.Exif()
+        # The ImageDescription tag
+        exif[0x010e] = 'An image'
+        for fmt in ['JPEG', 'PNG']:
+            data = make_image(fmt, icc_profile=get_icc_profile(), exif=exif)
+            for operation, status, target in convert_all(self.backend, data,
+                                                         self.tmp_dir):
+                with self.subTest(fmt=fmt, operation=operation):
+                    self.assertEqual(status, 0)
+                    with Image.open(target) as image:
+                        self.assertNotIn('icc_profile', image.info)
+                        self.assertNotIn('exif', image.info)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# Tests of the compiled translation index of translate_desktop_files
+
+import contextlib
+import io
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+
+try:
+    import polib
+except ImportError:
+    polib = None
+
+if polib:
+    import translate_desktop_files
+
+@unittest.skipIf(polib is None, 'polib is not installed')
+class TranslationsCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        po = polib.POFile()
+        po.append(polib.POEntry(msgid='Maps', msgstr='Mapas',
+                                msgctxt='title'))
+        po.save(os.path.join(self.tmp_dir, 'es.po'))
+        self.cache_path = os.path.join(self.tmp_dir, 'translations.pickle')
+        for patcher in [
+                mock.patch.object(translate_desktop_files, 'PO_DIR',
+                                  self.tmp_dir),
+                mock.patch.object(translate_desktop_files,
+                                  'TRANSLATIONS_CACHE', self.cache_path),
+                mock.patch.dict(translate_desktop_files._strings_dicts,
+                                clear=True)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def load(self):
+        translate_desktop_files._strings_dicts.clear()
+        return translate_desktop_files.load_strings_dict(['es'])
+
+    def write_cache(self, cache):
+        with open(self.cache_path, 'wb') as cache_file:
+            pickle.dump(cache, cache_file)
+
+    def test_saved_index_is_reused(self):
+        self.assertEqual(self.load()['es'][('Maps', 'title')], 'Mapas')
+        with mock.patch.object(translate_desktop_files, 'build_strings_dict',
+                               side_effect=AssertionError('Parsed again')):
+            self.assertEqual(self.load()['es'][('Maps', 'title')], 'Mapas')
+
+    def test_invalid_cache_is_rebuilt(self):
+        version = translate_desktop_files.TRANSLATIONS_CACHE_VERSION
+        invalid_caches = [
+            ['not', 'a', 'dict'],
+            {'version': version},
+            {'version': version, 'langs': ['es']},
+            {'version': version, 'langs': {'es': None}},
+            {'version': version, 'langs': {'es': {'stamp': None}}},
+            {'version': version, 'langs': {'es': {'stamp': None,
+                                                  'strings': 'Mapas'}}},
+        ]
+        for cache in invalid_caches:
+            with self.subTest(cache=cache):
+                self.write_cache(cache)
+                self.assertEqual(self.load()['es'][('Maps', 'title')],
+                                 'Mapas')
+
+    def test_corrupt_cache_is_rebuilt(self):
+        with open(self.cache_path, 'wb') as cache_file:
+            cache_file.write(b'\x80\x04not a pickle')
+        self.assertEqual(self.load()['es'][('Maps', 'title')], 'Mapas')
+
+    def test_unsaved_cache_warns_on_stderr(self):
+        os.mkdir(self.cache_path + '.tmp')
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        with contextlib.redirect_stdout(stdout), \
+             contextlib.redirect_stderr(stderr):
+            self.assertEqual(self.load()['es'][('Maps', 'title')], 'Mapas')
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertIn('Could not save translations cache', stderr.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
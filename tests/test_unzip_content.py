@@ -0,0 +1,140 @@
+# Test of the content import on a small synthetic CMS zip file
+#
+# The generated text files are compared with the expected ones in
+# tests/data/unzip_content, while only the names of the converted images
+# are compared, since their contents depend on the imaging library.
+# The folders are left out, since they come from the tree rather than
+# from the zip file.
+#
+# After an intended change of the output, update the expected files with
+#   python3 tests/test_unzip_content.py --update
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+TOP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOP_DIR)
+
+try:
+    import PIL
+    import polib
+except ImportError:
+    PIL = None
+
+if PIL:
+    import benchmark_import
+    import translate_desktop_files
+    from benchmark_import import SyntheticAppstore
+    from unzip_content import ContentImporter
+
+EXPECTED_DIR = os.path.join(TOP_DIR, 'tests', 'data', 'unzip_content')
+# File listing the images and icons that are expected to be generated
+EXPECTED_ASSETS = 'assets.txt'
+TEXT_EXTENSIONS = ('.json', '.txt', '.desktop')
+IGNORED_DIRS = [os.path.join('data', 'folders')]
+
+APPS = 4
+LINKS = 4
+LOCALES = 2
+# The images are much smaller than the CMS ones, with the same aspect
+# ratios, which keeps the test quick
+IMAGE_SIZES = {
+    'icon': (64, 64),
+    'thumb': (85, 85),
+    'featured': (298, 100),
+    'screenshot': (240, 135),
+    'splash': (240, 135),
+    'link-image': (50, 50),
+    'link-icon': (64, 64)
+}
+
+# Return the text files and the other files generated in output_dir,
+# as sorted lists of paths relative to it
+def list_output(output_dir):
+    text_files = []
+    assets = []
+    for dirpath, dirnames, filenames in os.walk(output_dir):
+        rel_dir = os.path.relpath(dirpath, output_dir)
+        if rel_dir in IGNORED_DIRS:
+            dirnames[:] = []
+            continue
+        for filename in filenames:
+            path = os.path.normpath(os.path.join(rel_dir, filename))
+            if filename.endswith(TEXT_EXTENSIONS):
+                text_files.append(path)
+            else:
+                assets.append(path)
+    return sorted(text_files), sorted(assets)
+
+def run_import(tmp_dir):
+    """Import a synthetic zip file, returning the output directory"""
+    zip_filename = os.path.join(tmp_dir, 'appstore.zip')
+    output_dir = os.path.join(tmp_dir, 'output')
+    with mock.patch.dict(benchmark_import.IMAGE_SIZES, IMAGE_SIZES):
+        SyntheticAppstore(APPS, LINKS, LOCALES).write(zip_filename)
+    # The folders, web apps and translations are read from the tree,
+    # while the translations cache is kept out of it
+    cwd = os.getcwd()
+    os.chdir(TOP_DIR)
+    try:
+        with mock.patch.object(translate_desktop_files, 'TRANSLATIONS_CACHE',
+                               os.path.join(tmp_dir, 'translations.pickle')):
+            importer = ContentImporter(zip_filename, output_dir, 'pillow', 2)
+            importer.run()
+    finally:
+        os.chdir(cwd)
+    if importer.converter.failed:
+        raise RuntimeError('Could not convert %s' % importer.converter.failed)
+    return output_dir
+
+def update_expected(output_dir):
+    shutil.rmtree(EXPECTED_DIR, True)
+    text_files, assets = list_output(output_dir)
+    for path in text_files:
+        target = os.path.join(EXPECTED_DIR, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(os.path.join(output_dir, path), target)
+    with open(os.path.join(EXPECTED_DIR, EXPECTED_ASSETS), 'w') as assets_file:
+        for path in assets:
+            assets_file.write(path + '\n')
+
+@unittest.skipIf(PIL is None, 'Pillow or polib is not installed')
+class ImportTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.output_dir = run_import(cls.tmp_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_text_files(self):
+        text_files, assets = list_output(self.output_dir)
+        expected_files, expected_assets = list_output(EXPECTED_DIR)
+        self.assertEqual(text_files,
+                         [path for path in expected_files
+                          if path != EXPECTED_ASSETS])
+        for path in text_files:
+            with self.subTest(path=path):
+                with open(os.path.join(self.output_dir, path)) as output, \
+                     open(os.path.join(EXPECTED_DIR, path)) as expected:
+                    self.assertEqual(output.read(), expected.read())
+
+    def test_assets(self):
+        text_files, assets = list_output(self.output_dir)
+        with open(os.path.join(EXPECTED_DIR, EXPECTED_ASSETS)) as assets_file:
+            expected = assets_file.read().splitlines()
+        self.assertEqual(assets, expected)
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--update']:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            update_expected(run_import(tmp_dir))
+    else:
+        unittest.main()
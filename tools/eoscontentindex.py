@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+#
+# Copyright (C) 2017 Endless Mobile, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import json
+
+EOS_CONTENT_JSON = '/usr/share/eos-shell-content/content.json'
+
+# For Endless apps, try removing the trailing locale ('.xx' or '.xx_YY')
+# from the app id
+def strip_locale(app_id):
+    if not app_id.startswith('com.endlessm.'):
+        return None
+    if app_id[len(app_id) - 3] == '.':
+        return app_id[0 : len(app_id) - 3]
+    if app_id[len(app_id) - 3] == '_' and app_id[len(app_id) - 6] == '.':
+        return app_id[0 : len(app_id) - 6]
+    return None
+
+class ContentIndex:
+    """Index of the apps in content.json.
+
+    Apps can be looked up by their ID, with or without a trailing locale,
+    and by their title. When several apps share an ID or a title, the
+    first one in content.json is returned, as a linear search would.
+    The app dictionaries are shared with the apps list, so changes made
+    to them are seen by all the lookups.
+    """
+
+    def __init__(self, apps):
+        self.apps = apps
+        self._by_id = {}
+        self._by_title = {}
+        for app in apps:
+            self._by_id.setdefault(app['application-id'], app)
+            self._by_title.setdefault(app['title'], app)
+
+    def __iter__(self):
+        return iter(self.apps)
+
+    def __len__(self):
+        return len(self.apps)
+
+    def get(self, app_id):
+        """Get the app with exactly this ID, or None."""
+        return self._by_id.get(app_id)
+
+    def get_unlocalized(self, app_id):
+        """Get the app with this ID, or None.
+
+        If there is no exact match, "localized" IDs of Endless apps are also
+        tried without their locale. E.g. the metadata of
+        "com.endlessm.howto" is valid for "com.endlessm.howto.en".
+        """
+        app = self._by_id.get(app_id)
+        if app is not None:
+            return app
+
+        unlocalized_id = strip_locale(app_id)
+        if unlocalized_id:
+            return self._by_id.get(unlocalized_id)
+        return None
+
+    def get_by_title(self, title):
+        """Get the app with this title, or None."""
+        return self._by_title.get(title)
+
+_indexes = {}
+
+def load_content_index(path=EOS_CONTENT_JSON):
+    """Get the index of a content.json file, which is only loaded once."""
+    index = _indexes.get(path)
+    if index is None:
+        with open(path) as content_file:
+            index = ContentIndex(json.load(content_file))
+        _indexes[path] = index
+    return index
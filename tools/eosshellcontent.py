@@ -20,23 +20,31 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 import collections
-import gi
-gi.require_version('AppStreamGlib', '1.0')
-from gi.repository import AppStreamGlib
-from gi.repository import Gio
+from eoscontentindex import EOS_CONTENT_JSON, load_content_index
 import glob
-import json
+import gzip
+import io
+import mmap
 import os
-import polib
 import re
+import struct
 import sys
-import xml.dom.minidom
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
 
 CMS_GS_BUCKET_URL = 'https://d3lapyynmdp1i9.cloudfront.net'
 DEFAULT_HOMEPAGE = 'https://endlessm.com'
 LOCALES_DIR = '/usr/share/locale/'
-EOS_CONTENT_JSON = '/usr/share/eos-shell-content/content.json'
+MO_FILE_NAME = 'eos-shell-content.mo'
+MERGED_METADATA_KEY = 'Endless::EosShellContent::Merged'
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+XML_INDENT = '  '
+# Description markup elements whose content is text with inline markup
+MARKUP_TEXT_TAGS = ('p', 'li')
+# Contexts of the content messages translated in the apps
+CONTENT_CONTEXTS = ('title', 'subtitle', 'description')
+CATALOG_ORIGIN = 'eos-shell-content'
+CATALOG_VERSION = '0.8'
 
 class NoMetadataException(Exception):
     def __init__(self, appid):
@@ -44,70 +52,228 @@ class NoMetadataException(Exception):
     def __str__(self):
         return 'No metadata found for app ID {0} in "{1}"'.format(self.appid, EOS_CONTENT_JSON)
 
+def _read_mo_header(data, mo_file_path):
+    """Read the header of a compiled gettext catalog.
+
+    Returns the byte order of the file, for use with struct, the number
+    of messages and the offsets of the tables of original and translated
+    strings.
+    """
+    magic = struct.unpack('<I', data[:4])[0]
+    if magic == 0x950412de:
+        order = '<'
+    elif magic == 0xde120495:
+        order = '>'
+    else:
+        raise ValueError('{0} is not a valid .mo file'.format(mo_file_path))
+    count, ids_offset, strs_offset = struct.unpack(order + '4x4x3I',
+                                                   data[:20])
+    return order, count, ids_offset, strs_offset
+
+class MoCatalog(object):
+    """Compiled gettext catalog whose messages are looked up in place.
+
+    The original strings of a .mo file are sorted, so rather than
+    decoding all the messages when the catalog is opened, each message
+    is found by a binary search of the memory mapped file. Only the few
+    strings compared are read, which makes looking up a message in all
+    the catalogs cheap when most of them do not translate it.
+
+    Messages are looked up with get(), using (msgid, msgctxt) keys, where
+    msgctxt is None for messages without a context, or all of them are
+    read with items().
+    """
+
+    def __init__(self, mo_file_path):
+        with open(mo_file_path, 'rb') as mo_file:
+            self._data = mmap.mmap(mo_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (self._order, self._count, self._ids_offset,
+         self._strs_offset) = _read_mo_header(self._data, mo_file_path)
+
+    def _get_string(self, table_offset, index):
+        length, offset = struct.unpack_from(self._order + '2I', self._data,
+                                            table_offset + 8 * index)
+        return self._data[offset:offset + length]
+
+    def get(self, key, default=None):
+        msgid, msgctxt = key
+        if msgctxt is not None:
+            msgid = msgctxt + '\x04' + msgid
+        msgid = msgid.encode('utf-8')
+
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            original = self._get_string(self._ids_offset, middle)
+            if original < msgid:
+                low = middle + 1
+            elif original > msgid:
+                high = middle
+            else:
+                return self._get_string(self._strs_offset, middle).decode('utf-8')
+        return default
+
+    def items(self):
+        """Iterate over the ((msgid, msgctxt), msgstr) pairs of all the
+        messages, skipping the catalog header and plural messages."""
+        for index in range(self._count):
+            original = self._get_string(self._ids_offset, index)
+            if not original or b'\0' in original:
+                continue
+            msgctxt, sep, msgid = original.decode('utf-8').rpartition('\x04')
+            msgstr = self._get_string(self._strs_offset, index).decode('utf-8')
+            yield (msgid, msgctxt if sep else None), msgstr
+
+def _get_appstream_glib():
+    # Only the AppStreamGlib apps need gi, so it is imported when first
+    # used, and merging appdata files with ElementTree works without it
+    import gi
+    gi.require_version('AppStreamGlib', '1.0')
+    from gi.repository import AppStreamGlib
+    return AppStreamGlib
+
 def load_as_app_from_appdata(appdata_file):
+    AppStreamGlib = _get_appstream_glib()
     app = AppStreamGlib.App()
     app.parse_file(appdata_file, AppStreamGlib.AppParseFlags.NONE)
     return app
 
+def _parse_markup(markup):
+    """Parse description markup into a list of elements.
+
+    Text that is not within any element is kept as the text of
+    a paragraph, as is the text of markup that is not valid XML.
+    """
+    try:
+        container = ET.fromstring('<description>{0}</description>'.format(markup))
+    except ET.ParseError:
+        paragraph = ET.Element('p')
+        paragraph.text = re.sub('<[^>]*>', '', markup)
+        return [paragraph]
+
+    elements = list(container)
+    if container.text and container.text.strip():
+        paragraph = ET.Element('p')
+        paragraph.text = container.text.strip()
+        elements.insert(0, paragraph)
+    return elements
+
+def _split_description(description):
+    """Split the markup of a description element by language.
+
+    Returns an OrderedDict of lists of elements indexed by their xml:lang,
+    or None for the untranslated ones. The items of lists are translated
+    individually in appdata files, so each list is split into one list
+    per language.
+    """
+    markup = collections.OrderedDict()
+    for element in description:
+        if element.tag in ('ul', 'ol'):
+            lists = collections.OrderedDict()
+            for item in element:
+                lang = item.get(XML_LANG)
+                if lang not in lists:
+                    lists[lang] = ET.Element(element.tag, element.attrib)
+                lists[lang].append(item)
+            for lang, items in lists.items():
+                markup.setdefault(lang, []).append(items)
+        else:
+            markup.setdefault(element.get(XML_LANG), []).append(element)
+    return markup
+
+def _set_lang(element, lang):
+    # Lists are translated by their items, as in appdata files
+    if element.tag in ('ul', 'ol'):
+        for item in element:
+            _set_lang(item, lang)
+    elif lang is None:
+        element.attrib.pop(XML_LANG, None)
+    else:
+        element.set(XML_LANG, lang)
+
+def _sort_langs(langs):
+    # Untranslated values first, then the translations by language
+    return sorted(langs, key=lambda lang: (lang is not None, lang or ''))
+
+def _indent(element, level=0):
+    """Indent the tree in place, one level per nesting of elements.
+
+    Only elements that contain nothing but other elements are indented.
+    Mixed content, such as the text and inline markup of the description
+    paragraphs and list items, is left as it is.
+    """
+    if len(element) == 0 or element.tag in MARKUP_TEXT_TAGS:
+        return
+    if (element.text and element.text.strip()) or \
+       any(child.tail and child.tail.strip() for child in element):
+        return
+    child_indent = '\n' + XML_INDENT * (level + 1)
+    element.text = child_indent
+    for child in element:
+        _indent(child, level + 1)
+        child.tail = child_indent
+    child.tail = '\n' + XML_INDENT * level
+
 class ShellContent:
 
     def __init__(self):
-        self._translations, self._langs = self._get_translations_dict()
+        self._langs = self._get_langs()
+        # Translations are only loaded when first needed for a language
+        self._translations = {}
+        # Languages translating each content message, when indexed
+        self._translation_index = None
         # Regex for matching anything starting with a <tag> like format
         self._tag_expression = re.compile('^\s*\<\w+\>.*')
 
-    def _get_translations_dict(self):
-        """Get translations dictionary and list of languages.
-
-        It reads the translations from a predefined file and returns a dictionary
-        with the translated strings and a list of the available languages.
-        """
-        strings_dict = {}
-        langs = []
+    def _get_mo_file_path(self, lang):
+        return os.path.join(LOCALES_DIR, lang, 'LC_MESSAGES', MO_FILE_NAME)
 
-        for lang in os.listdir(LOCALES_DIR):
-            mo_file_path = os.path.join(LOCALES_DIR, lang, 'LC_MESSAGES', 'eos-shell-content.mo')
-            if not os.path.exists(mo_file_path):
-                continue
-            langs.append(lang)
-            mo_file = polib.mofile(mo_file_path)
-            strings_dict[lang] = {(entry.msgid, entry.msgctxt): entry.msgstr for entry in mo_file}
+    def _get_langs(self):
+        """Get the list of languages which have translations."""
+        return [lang for lang in os.listdir(LOCALES_DIR)
+                if os.path.exists(self._get_mo_file_path(lang))]
 
-        return (strings_dict, langs)
+    def _get_translations(self, lang):
+        """Get the translations of a language.
 
-    def _get_app_metadata(self, app_id):
-        all_metadata = json.load(open(EOS_CONTENT_JSON))
-
-        for i in range(len(all_metadata)):
-            metadata = all_metadata[i]
-            metadata_id = metadata['application-id']
-            if metadata_id == app_id:
-                return metadata
-
-            # Take into account "localized" IDs for Endless applications.
-            # E.g. and app ID of "com.endlessm.howto" in the metadata is a valid
-            # metadata for "com.endlessm.howto.en"
-            components = app_id.rsplit('.', 1)
-            unlocalized_id = components[0]
+        The translated strings are looked up with get() by (msgid, msgctxt)
+        tuples. The language's catalog is opened the first time it is
+        needed, and each message is then only read from it when looked up.
+        """
+        messages = self._translations.get(lang)
+        if messages is None:
             try:
-                locale = components[1]
-            except:
-                locale = ''
-
-                # Check the locale component looks like a locale, and only apply
-                # this heuristic for com.endlessm. applications
-                if unlocalized_id.startswith('com.endlessm.') and \
-                   (len(locale) == 2 or (len(locale) == 5 and locale[2] == '_')) and \
-                   metadata_id == unlocalized_id:
-                    return metadata
-
-        return None
+                messages = MoCatalog(self._get_mo_file_path(lang))
+            except (OSError, ValueError) as err:
+                print('Could not read translations for {0}: {1}'.format(lang, err),
+                      file=sys.stderr)
+                messages = {}
+            self._translations[lang] = messages
+        return messages
+
+    def index_translations(self):
+        """Index the content translations of all the languages at once.
+
+        The catalogs are read in a single pass, mapping each (msgid,
+        msgctxt) of the content to the languages that translate it, so
+        that each app then only visits the languages that have its title.
+        This pays off when merging many apps, while the catalogs of a
+        single app are better looked up as needed.
+        """
+        if self._translation_index is not None:
+            return
+        index = {}
+        for lang in self._langs:
+            for key, msgstr in self._get_translations(lang).items():
+                if key[1] in CONTENT_CONTEXTS and msgstr:
+                    index.setdefault(key, collections.OrderedDict())[lang] = msgstr
+        self._translation_index = index
 
-    def _translate_field(self, lang, field, msg):
-        messages = self._translations.get(lang)
-        if not messages:
-            return ''
-        return messages.get((msg, field), '')
+    def _get_app_metadata(self, app_id):
+        # Take into account "localized" IDs for Endless applications.
+        # E.g. and app ID of "com.endlessm.howto" in the metadata is a valid
+        # metadata for "com.endlessm.howto.en"
+        return load_content_index(EOS_CONTENT_JSON).get_unlocalized(app_id)
 
     def _add_paragraph_tags_if_needed(self, text):
         if not text:
@@ -120,15 +286,33 @@ class ShellContent:
         # Otherwise format the text
         return '<p>{}</p>'.format(text)
 
-    def _translate_app(self, app):
+    def _get_translated_metadata(self, metadata):
+        """Get the translations of the title, subtitle and description.
+
+        Yields (locale, name, summary, description) tuples for the
+        languages that have a translation of the title, with empty strings
+        for the other fields when they are not translated.
+        """
+        title = (metadata['title'], 'title')
+        subtitle = (metadata['subtitle'], 'subtitle')
+        description = (metadata['description'], 'description')
+        if self._translation_index is not None:
+            # The languages are indexed in the same order as self._langs
+            summaries = self._translation_index.get(subtitle, {})
+            descriptions = self._translation_index.get(description, {})
+            for locale, name in self._translation_index.get(title, {}).items():
+                yield locale, name, summaries.get(locale, ''), descriptions.get(locale, '')
+            return
         for locale in self._langs:
-            name = self._translate_field(locale, 'title', app.get_name('C'))
+            # The other fields are only looked up when the title is translated
+            messages = self._get_translations(locale)
+            name = messages.get(title)
             if not name:
                 continue
+            yield locale, name, messages.get(subtitle, ''), messages.get(description, '')
 
-            summary = self._translate_field(locale, 'subtitle', app.get_comment('C'))
-            description = self._translate_field(locale, 'description', app.get_description('C'))
-
+    def _translate_app(self, app, metadata):
+        for locale, name, summary, description in self._get_translated_metadata(metadata):
             app.set_name(locale, name)
             if summary:
                 app.set_comment(locale, summary)
@@ -141,8 +325,12 @@ class ShellContent:
                                                                        locale=locale,
                                                                        image=image)
 
-    def update_app(self, app, content_app_id=''):
-        app_id = content_app_id or app.get_id()
+    def _find_app_metadata(self, app_id):
+        """Get the content app ID and metadata for an app ID.
+
+        The app ID is also tried without its '.desktop' suffix, and
+        NoMetadataException is raised if there is no metadata for it.
+        """
         metadata = self._get_app_metadata(app_id)
 
         if not metadata:
@@ -152,6 +340,34 @@ class ShellContent:
             if not metadata:
                 raise NoMetadataException(app_id)
 
+        return app_id, metadata
+
+    def _get_screenshot_urls(self, app_id, metadata):
+        """Get the screenshot URLs of an app, grouped by screenshot.
+
+        Screenshots in the metadata are arranged as
+        'language' -> ['image', ...] but we need to group the same images
+        in the same screenshot (with a different language each), so we
+        invert the arrangement and return a list of [(locale, url), ...]
+        for each screenshot.
+
+        The order of the screenshots as found in the metadata is kept,
+        since it can be important.
+        """
+        # Apps without screenshots have an empty list rather than a dictionary
+        screenshots = collections.OrderedDict()
+        for locale, images in (metadata.get('screenshots') or {}).items():
+            for image in images:
+                screenshots.setdefault(image, []).append(locale)
+
+        return [[(locale, self._get_screenshot_url(app_id, locale, image))
+                 for locale in locales]
+                for image, locales in screenshots.items()]
+
+    def update_app(self, app, content_app_id=''):
+        AppStreamGlib = _get_appstream_glib()
+        app_id, metadata = self._find_app_metadata(content_app_id or app.get_id())
+
         app.set_name('C', metadata['title'])
         app.set_comment('C', metadata['subtitle'])
         description = metadata['description']
@@ -161,33 +377,21 @@ class ShellContent:
         for category in categories.split(';'):
             app.add_category(category)
 
-        # Screenshots in the metadata are arranged as 'language' -> ['image', ...]
-        # but we need to group the same images in the same screenshot (with a
-        # different language each), so we invert the arrangement as:
-        # 'image' -> ['language', ...]
-        #
-        # Use an OrderedDict so we maintain the order of the screenshots as found
-        # in the metadata which can be important.
-        screenshots = collections.OrderedDict()
-        for locale, images in metadata.get('screenshots', {}).items():
-            for image in images:
-                screenshots.setdefault(image, []).append(locale)
-
-        for image, locales in screenshots.items():
+        for urls in self._get_screenshot_urls(app_id, metadata):
             screenshot = AppStreamGlib.Screenshot()
-            for locale in locales:
+            for locale, url in urls:
                 as_img = AppStreamGlib.Image()
                 # We need to add the screenshots as source, otherwise, without a
                 # caption and other elements, AppStreamGlib discards the screenshots
                 # as duplicates...
                 as_img.set_kind(AppStreamGlib.ImageKind.SOURCE)
-                as_img.set_url(self._get_screenshot_url(app_id, locale, image))
+                as_img.set_url(url)
                 if locale != 'C':
                     as_img.set_locale(locale)
                 screenshot.add_image(as_img)
             app.add_screenshot(screenshot)
 
-        self._translate_app(app)
+        self._translate_app(app, metadata)
         # We only format the description now otherwise it would not
         # match the translations
         app.set_description('C', self._add_paragraph_tags_if_needed(description))
@@ -196,7 +400,7 @@ class ShellContent:
         images = xml_root.findall('./screenshots/screenshot/image')
         has_shell_content_screenshots = False
         for image in images:
-            if image.text.startswith(CMS_GS_BUCKET_URL):
+            if image.text and image.text.startswith(CMS_GS_BUCKET_URL):
                 has_shell_content_screenshots = True
                 break
 
@@ -206,33 +410,206 @@ class ShellContent:
 
         # Remove all screenshots that had only images not starting with our URL
         screenshots = xml_root.find('screenshots')
-        for screenshot in screenshots:
+        for screenshot in list(screenshots):
             for image in screenshot.findall('image'):
-                if not image.text.startswith(CMS_GS_BUCKET_URL):
+                if not image.text or not image.text.startswith(CMS_GS_BUCKET_URL):
                     screenshot.remove(image)
             if not screenshot.findall('image'):
                 screenshots.remove(screenshot)
 
-    def update_appdata_from_file(self, file_path, content_app_id=''):
-        app = load_as_app_from_appdata(file_path)
-        self.update_app(app, content_app_id)
+    def _set_localized_elements(self, component, tag, values):
+        """Set the text of the localized elements of a component.
+
+        values is a dictionary of the texts indexed by locale, or None for
+        the untranslated text, which replace those of the same locale.
+        The elements of other locales are kept, and all of them are sorted
+        by locale where the first of them was.
+        """
+        elements = {}
+        position = len(component)
+        for i, element in enumerate(component.findall(tag)):
+            if i == 0:
+                position = list(component).index(element)
+            elements.setdefault(element.get(XML_LANG), element)
+            component.remove(element)
+
+        for lang, text in values.items():
+            element = ET.Element(tag)
+            element.text = text
+            _set_lang(element, lang)
+            elements[lang] = element
+
+        for lang in _sort_langs(elements):
+            component.insert(position, elements[lang])
+            position += 1
+
+    def _set_description(self, component, values):
+        """Set the description markup of a component.
+
+        values is a dictionary of the markup indexed by locale, or None for
+        the untranslated markup, which replaces that of the same locale.
+        """
+        description = component.find('description')
+        if description is None:
+            description = ET.SubElement(component, 'description')
+        markup = _split_description(description)
+        for lang, text in values.items():
+            markup[lang] = _parse_markup(text)
+
+        description.clear()
+        for lang in _sort_langs(markup):
+            for element in markup[lang]:
+                _set_lang(element, lang)
+                description.append(element)
+
+    def _add_categories(self, component, categories):
+        element = component.find('categories')
+        if element is None:
+            element = ET.SubElement(component, 'categories')
+        existing = set(category.text for category in element.findall('category'))
+        for category in categories.split(';'):
+            if category and category not in existing:
+                ET.SubElement(element, 'category').text = category
+                existing.add(category)
+
+    def _add_screenshots(self, component, screenshot_urls):
+        element = component.find('screenshots')
+        if element is None:
+            element = ET.SubElement(component, 'screenshots')
+
+        # Replace the screenshots of a previous merge, so that merging
+        # again does not duplicate them
+        for screenshot in element.findall('screenshot'):
+            for image in screenshot.findall('image'):
+                if image.text and image.text.startswith(CMS_GS_BUCKET_URL):
+                    element.remove(screenshot)
+                    break
+
+        for urls in screenshot_urls:
+            screenshot = ET.SubElement(element, 'screenshot')
+            for locale, url in urls:
+                image = ET.SubElement(screenshot, 'image', type='source')
+                image.text = url
+                if locale != 'C':
+                    image.set(XML_LANG, locale)
+
+        if not len(element):
+            component.remove(element)
+
+    def _set_metadata(self, component, key, value):
+        element = component.find('metadata')
+        if element is None:
+            element = ET.SubElement(component, 'metadata')
+        for item in element.findall('value'):
+            if item.get('key') == key:
+                element.remove(item)
+        ET.SubElement(element, 'value', key=key).text = value
+
+    def _apply_metadata(self, component, app_id, metadata):
+        description = metadata['description']
+        names = {None: metadata['title']}
+        summaries = {None: metadata['subtitle']}
+        # We format the untranslated description, as we only format it
+        # after translating it when updating an AppStreamGlib app
+        descriptions = {None: self._add_paragraph_tags_if_needed(description)}
+        for locale, name, summary, translation in self._get_translated_metadata(metadata):
+            names[locale] = name
+            if summary:
+                summaries[locale] = summary
+            if translation:
+                descriptions[locale] = self._add_paragraph_tags_if_needed(translation)
+
+        self._set_localized_elements(component, 'name', names)
+        self._set_localized_elements(component, 'summary', summaries)
+        self._set_description(component, descriptions)
+        self._add_categories(component, metadata.get('category', ''))
+        self._add_screenshots(component, self._get_screenshot_urls(app_id, metadata))
+        self._remove_unneeded_screenshots(component)
+
+    def merge_appdata(self, component, content_app_id=''):
+        """Merge the content into the component element of an appdata tree.
+
+        This does the same as update_app, followed by the removal of the
+        third party screenshots, but editing the element in place.
+        """
+        app_id, metadata = self._find_app_metadata(content_app_id or
+                                                   component.findtext('id', '').strip())
+
+        # Legacy appdata files have an application element
+        if component.tag == 'application':
+            component.tag = 'component'
+            component.set('type', 'desktop')
+
+        self._apply_metadata(component, app_id, metadata)
 
         # Add a special metadata item in order to easily check if this app-data
         # file has been merged by eos-shell-content
-        app.add_metadata('Endless::EosShellContent::Merged', 'true')
+        self._set_metadata(component, MERGED_METADATA_KEY, 'true')
 
-        store = AppStreamGlib.Store()
-        store.add_app(app)
-        xml_str = store.to_xml(AppStreamGlib.NodeToXmlFlags.NONE).str
-        root = ET.fromstring(xml_str)
-        if root.tag == 'components':
-            root = root.find('component')
+    def create_component(self, metadata):
+        """Create the component element of an app of content.json.
+
+        The component has the same content that merge_appdata adds to
+        an appdata file, and is launched by the desktop file of the app.
+        """
+        app_id = metadata['application-id']
+        component = ET.Element('component', type='desktop')
+        ET.SubElement(component, 'id').text = app_id
+        self._apply_metadata(component, app_id, metadata)
+        ET.SubElement(component, 'launchable',
+                      type='desktop-id').text = app_id + '.desktop'
+        return component
 
-        # We do not want to display screenshots from 3rd parties when we have
-        # provided some from the Shell Content, so we need to remove them.
-        # The removal should be done in the app object but this cannot be
-        # accomplished until there is API to do it in libappstream-glib.
-        self._remove_unneeded_screenshots(root)
+    def update_appdata_from_file(self, file_path, content_app_id=''):
+        """Merge the content into an appdata file and return the new XML.
 
-        node = xml.dom.minidom.parseString(ET.tostring(root, encoding='utf-8'))
-        return node.toprettyxml(indent='  ')
+        The file is parsed once and edited in place, rather than going
+        through an AppStreamGlib app, and is serialized with a fixed
+        indentation so that the output only depends on the input.
+        """
+        root = ET.parse(file_path).getroot()
+        if root.tag == 'components':
+            root = root.find('component')
+        self.merge_appdata(root, content_app_id)
+
+        _indent(root)
+        root.tail = '\n'
+        return '<?xml version="1.0" encoding="UTF-8"?>\n' + \
+            ET.tostring(root, encoding='unicode')
+
+def write_catalog(path, shell_content, apps, origin=CATALOG_ORIGIN):
+    """Write the apps of content.json as a gzipped AppStream collection.
+
+    The components are written one at a time as they are created, so
+    only one of them is in memory at once. The catalog is written to
+    a temporary file which then replaces path, and its gzip header has
+    no timestamp, so that the same content gives the same file. Apps
+    that appear more than once are only written the first time, and
+    the translations of all the apps are indexed up front.
+    Returns the number of apps written.
+    """
+    shell_content.index_translations()
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    written = set()
+    try:
+        with open(tmp_path, 'wb') as raw_file, \
+             gzip.GzipFile(filename='', mode='wb', fileobj=raw_file, mtime=0) as gz_file, \
+             io.TextIOWrapper(gz_file, encoding='utf-8') as catalog:
+            catalog.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            catalog.write('<components version="{0}" origin={1}>\n'.format(
+                CATALOG_VERSION, quoteattr(origin)))
+            for metadata in apps:
+                app_id = metadata['application-id']
+                if app_id in written:
+                    continue
+                component = shell_content.create_component(metadata)
+                _indent(component, 1)
+                component.tail = '\n'
+                catalog.write(XML_INDENT + ET.tostring(component, encoding='unicode'))
+                written.add(app_id)
+            catalog.write('</components>\n')
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return len(written)
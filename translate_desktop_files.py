@@ -2,14 +2,24 @@
 
 # This script accepts a directory of desktop.in files, and outputs desktop files
 # with localized strings for every localestring key/value pair. Requires polib
+#
+# Parsing all the .po files takes a while, so the parsed translations are
+# kept in a compiled index, both in memory and in a pickle file that is
+# reused by later runs until any of the .po files change
 
 import os
 import argparse
+import multiprocessing
+import pickle
 import polib
 import re
+import sys
 
 PO_DIR = 'po'
 LINGUAS_FILE = os.path.join(PO_DIR, 'LINGUAS')
+TRANSLATIONS_CACHE = '.translations-cache.pickle'
+# Bump this whenever the format of the compiled index changes
+TRANSLATIONS_CACHE_VERSION = 1
 KEY_TO_CONTEXT_APPS = {
     'Name': 'title',
     'Comment': 'subtitle'
@@ -46,11 +56,164 @@ def build_strings_dict(langs):
 
     return strings_dict
 
-def translate_dir(in_dir):
+def get_linguas():
     with open(LINGUAS_FILE) as linguas:
-        langs = linguas.read().splitlines()
+        return linguas.read().splitlines()
+
+# The compiled index of each set of languages loaded by this process
+_strings_dicts = {}
 
-    strings_dict = build_strings_dict(langs)
+def _get_po_stamps(langs):
+    # The modification time and size of each .po file, used to detect
+    # whether the compiled index is out of date
+    stamps = {}
+    for lang in langs:
+        stat = os.stat(os.path.join(PO_DIR, lang + '.po'))
+        stamps[lang] = (stat.st_mtime_ns, stat.st_size)
+    return stamps
+
+def _read_translations_cache():
+    # Read the compiled index saved by an earlier run. The cache is only
+    # an optimization, so anything but a valid index of the current
+    # version, such as a stale or foreign pickle, is rebuilt from scratch
+    try:
+        with open(TRANSLATIONS_CACHE, 'rb') as cache_file:
+            cache = pickle.load(cache_file)
+        if cache['version'] == TRANSLATIONS_CACHE_VERSION:
+            for entry in cache['langs'].values():
+                if not isinstance(entry['strings'], dict):
+                    raise TypeError('Invalid translations of a language')
+            return cache
+    except Exception:
+        pass
+    return {'version': TRANSLATIONS_CACHE_VERSION, 'langs': {}}
+
+def load_strings_dict(langs=None):
+    """Get the translations of langs, as returned by build_strings_dict
+
+    The .po files are only parsed if they changed since the compiled
+    index was last saved, and only once per process. If langs is None,
+    the languages listed in the LINGUAS file are loaded.
+    """
+    if langs is None:
+        langs = get_linguas()
+    stamps = _get_po_stamps(langs)
+    key = tuple(langs)
+    cached = _strings_dicts.get(key)
+    if cached and cached['stamps'] == stamps:
+        return cached['strings']
+
+    cache = _read_translations_cache()
+
+    # Only parse the languages that are missing or out of date
+    strings_dict = {}
+    stale_langs = []
+    for lang in langs:
+        entry = cache['langs'].get(lang)
+        if entry and entry['stamp'] == stamps[lang]:
+            strings_dict[lang] = entry['strings']
+        else:
+            stale_langs.append(lang)
+    if stale_langs:
+        strings_dict.update(build_strings_dict(stale_langs))
+        for lang in stale_langs:
+            cache['langs'][lang] = {'stamp': stamps[lang],
+                                    'strings': strings_dict[lang]}
+        # Write to a temporary file first, so that the cache is never
+        # left half-written, and carry on without it if it can't be saved
+        tmp_path = TRANSLATIONS_CACHE + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as cache_file:
+                pickle.dump(cache, cache_file, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, TRANSLATIONS_CACHE)
+        except OSError as err:
+            print('Could not save translations cache: %s' % err,
+                  file=sys.stderr)
+
+    _strings_dicts[key] = {'stamps': stamps, 'strings': strings_dict}
+    return strings_dict
+
+# Matches desktop files of already-localized content
+LOCALE_REGEX = re.compile('^com\.endlessm\..+\.[a-z]{2,3}_?[A-Z]{0,2}.desktop$')
+
+def translate_desktop_in(in_path, text, langs, strings_dict):
+    """Translate the contents of a desktop.in or directory.in file
+
+    Returns the path and contents of the file to output in its place,
+    or the input unchanged if it should not be translated.
+    """
+    desktop_in_file = os.path.basename(in_path)
+
+    # don't translate already-localized content
+    if LOCALE_REGEX.match(desktop_in_file):
+        return in_path, text
+
+    if 'directory.in' in desktop_in_file:
+        key_to_context = KEY_TO_CONTEXT_FOLDERS
+    elif desktop_in_file.startswith('eos-link-'):
+        key_to_context = KEY_TO_CONTEXT_LINKS
+    else:
+        key_to_context = KEY_TO_CONTEXT_APPS
+
+    out_lines = []
+    for line in text.splitlines():
+        if is_localized_entry(line):
+            # remove the underscore and split the line into its components
+            stripped_line = line[1:]
+            [key, localestring] = stripped_line.split('=')
+
+            # first print the default string
+            out_lines.append(stripped_line + '\n')
+
+            for lang in langs:
+                try:
+                    msgctxt = key_to_context[key]
+                    translation = translate(strings_dict, localestring, lang, msgctxt)
+                    localized_line = "%s[%s]=%s" % (key, lang, translation)
+                    out_lines.append(localized_line + '\n')
+                except KeyError:
+                    pass
+        else:
+            out_lines.append(line + '\n')
+
+    # trim off the '.in' suffix
+    return in_path[:-3], ''.join(out_lines)
+
+# The translations used by the worker processes of translate_all()
+_worker_langs = None
+_worker_strings_dict = None
+
+def _init_worker(langs, strings_dict):
+    global _worker_langs, _worker_strings_dict
+    _worker_langs = langs
+    _worker_strings_dict = strings_dict
+
+def _translate_worker(item):
+    in_path, text = item
+    return translate_desktop_in(in_path, text, _worker_langs,
+                                _worker_strings_dict)
+
+def translate_all(items, processes=None):
+    """Translate a list of (path, contents) pairs of .in files
+
+    The files are translated with translate_desktop_in() on a pool of
+    worker processes, and the results are returned in the same order as
+    the items.
+    """
+    langs = get_linguas()
+    strings_dict = load_strings_dict(langs)
+    processes = processes or os.cpu_count()
+
+    # Hand out the files in large chunks, since each one is quick to
+    # translate compared to the cost of passing it to a worker
+    chunksize = max(1, len(items) // (processes * 4))
+    with multiprocessing.Pool(processes, _init_worker,
+                              (langs, strings_dict)) as pool:
+        return pool.map(_translate_worker, items, chunksize)
+
+def translate_dir(in_dir):
+    langs = get_linguas()
+    strings_dict = load_strings_dict(langs)
 
     # Iterate through only desktop.in and directory.in files,
     # and output them verbatim unless a key is prefixed with an underscore.
@@ -60,48 +223,18 @@ def translate_dir(in_dir):
                         if 'desktop.in' in filename
                         or 'directory.in' in filename]
 
-    locale_regex = re.compile('^com\.endlessm\..+\.[a-z]{2,3}_?[A-Z]{0,2}.desktop$')
-    
     for desktop_in_file in desktop_in_files:
+        in_path = os.path.join(in_dir, desktop_in_file)
+        with open(in_path, 'r') as in_file:
+            text = in_file.read()
 
-        # don't translate already-localized content
-        if locale_regex.match(desktop_in_file):
+        out_path, out_text = translate_desktop_in(in_path, text, langs,
+                                                  strings_dict)
+        if out_path == in_path:
             continue
 
-        in_path = os.path.join(in_dir, desktop_in_file)
-        in_file = open(in_path, 'r')
-        in_file_lines = in_file.read().splitlines()
-
-        # trim off the '.in' suffix
-        out_filename = desktop_in_file[:-3]
-        out_path = os.path.join(in_dir, out_filename)
-        out_file = open(out_path, 'w')
-
-        for line in in_file_lines:
-            if is_localized_entry(line):
-                # remove the underscore and split the line into its components
-                stripped_line = line[1:]
-                [key, localestring] = stripped_line.split('=')
-
-                # first print the default string
-                out_file.write(stripped_line + '\n')
-
-                for lang in langs:
-                    try:
-                        if 'directory.in' in desktop_in_file:
-                            msgctxt = KEY_TO_CONTEXT_FOLDERS[key]
-                        elif desktop_in_file.startswith('eos-link-'):
-                            msgctxt = KEY_TO_CONTEXT_LINKS[key]
-                        else:
-                            msgctxt = KEY_TO_CONTEXT_APPS[key]
-                        translation = translate(strings_dict, localestring, lang, msgctxt)
-                        localized_line = "%s[%s]=%s" % (key, lang, translation)
-                        out_file.write(localized_line + '\n')
-                    except KeyError:
-                        pass
-            else:
-                out_file.write(line + '\n')
+        with open(out_path, 'w') as out_file:
+            out_file.write(out_text)
 
         # finally, remove this .in file
-        in_file.close()
         os.remove(in_path)
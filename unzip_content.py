@@ -2,7 +2,9 @@
 
 # This script requires installing ImageMagick
 # (sudo apt-get install imagemagick)
-# for the 'convert' command
+# or, when run with --backend pillow, Pillow
+# (sudo apt-get install python3-pil)
+# for converting the image assets (see image_backends.py)
 
 # This script also requires polib
 # (sudo apt-get install python3-polib)
@@ -17,23 +19,37 @@
 # Add and commit any changes to git
 # Proceed with the normal build process
 
-import copy
+import io
 import json
 import operator
 import os
+import posixpath
 import shutil
 import sys
 import zipfile
 
+from asset_converter import CACHE_DIR, ConversionQueue
 from desktop_object import LinkObject, AppObject, FolderObject
 from extra_categories import EXTRA_CATEGORIES
 from extra_desktop_entries import EXTRA_DESKTOP_ENTRIES
-from translate_desktop_files import translate_dir
+from image_backends import BACKENDS, DEFAULT_BACKEND, ICON_SIZE
+from import_profiler import ImportProfiler
+from manifest_writers import (DEFAULT_MANIFEST_FORMATS, MANIFEST_WRITERS,
+                              write_manifests)
+from translate_desktop_files import translate_all
 from update_translation_info import merge_translation_info
 
+# The content index is shared with the installed tools
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                'tools'))
+from eoscontentindex import strip_locale
+
 ZIP_FILENAME = 'appstore.zip'
-UNZIP_DIR = 'unzipped'
 CONTENT_DIR = 'content/Default'
+# For now, the folders.json is not in the CMS output,
+# so we hard-code it in the directory above the processed content
+FOLDERS_JSON = 'content/folders.json'
+LINKS_SOURCE_DIR = 'links'
 DATA_DIR = 'data'
 BUNDLE_DIR = 'bundle'
 LINKS_DIR = os.path.join(DATA_DIR, 'links')
@@ -42,24 +58,150 @@ FOLDERS_DIR = os.path.join(DATA_DIR, 'folders')
 BUNDLE_MANIFESTS_DIR = os.path.join(BUNDLE_DIR, 'manifests')
 BUNDLE_ICON_DIR = os.path.join('icons', 'bundle', '64x64', 'apps')
 CORE_ICON_DIR = os.path.join('icons', 'core', '64x64', 'apps')
-ICON_MASK = '/tmp/icon_mask.png'
 IGNORE_ERRORS = True
-JPEG_QUALITY = 90
 APP_PREFIX = 'eos-app-'
 LINK_PREFIX = 'eos-link-'
 
-# Run the ImageMagick 'convert' application from the command line,
-# with specified JPEG quality and all metadata stripped
-def convert(source, target, command):
-    os.system('convert ' + source + ' ' + command +
-              ' -quality ' + str(JPEG_QUALITY) + ' -strip ' + target)
-
-# Use ImageMagick to round the corners based on a 60x60 square
-# with radius 15 rounding centered within the 64x64 asset
-def round_icon(source, target, command):
-    os.system('convert ' + source + ' ' + command + ' -matte ' + ICON_MASK +
-              ' -compose DstIn -composite' +
-              ' -strip -define png:exclude-chunks=date,time ' + target)
+# For now, we need to convert specific locales to personalities,
+# including duplication of en-us as both default and Global,
+# until the CMS is reworked
+LOCALES = ['en-us', 'en-us', 'es-gt', 'pt-br', 'zh_CN', 'ar', 'bn', 'id', 'th', 'vi']
+PERSONALITIES = ['default', 'Global', 'Guatemala', 'Brazil', 'China', 'Arabic', 'Bengali', 'Indonesia', 'Thailand', 'Vietnam']
+
+# For now, we also need to convert specific locales to general languages
+# (with 'C' as the fallback for English) and personalities,
+# until the CMS is reworked
+LANGUAGES = [None, 'C', 'es', 'pt', 'zh_CN', 'ar', 'bn', 'id', 'th', 'vi']
+
+# Language of each CMS locale that has one
+LOCALE_LANGUAGES = dict((locale, language)
+                        for locale, language in zip(LOCALES, LANGUAGES)
+                        if language)
+
+# Special handling of link locales for es vs. es_GT
+LINK_LOCALES = [['en-us'], ['es'], ['es', 'es-gt'], ['es', 'es-mx'], ['pt-br'], ['zh-hans'], ['bn'], ['id'], ['th'], ['vi']]
+LINK_LANGUAGES = ['C', 'es', 'es_GT', 'es_MX', 'pt_BR', 'zh_CN', 'bn', 'id', 'th', 'vi']
+
+# Map the screenshots of an app, indexed by CMS locale, to the generic
+# languages and converted file names used in the content folder
+def get_screenshot_languages(screenshots):
+    # Apps without screenshots have an empty list rather than a dictionary
+    if not screenshots:
+        return screenshots
+    return dict((LOCALE_LANGUAGES.get(locale, locale),
+                 [fname.replace('.png', '.jpg') for fname in fnames])
+                for locale, fnames in screenshots.items())
+
+class ContentArchive(object):
+    """Read-only view of the CMS zip file
+
+    Members are read straight from the archive when needed, rather than
+    first extracting the whole archive into a staging directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._zfile = zipfile.ZipFile(path)
+        self._files = set(name for name in self._zfile.namelist()
+                          if not name.endswith('/'))
+
+    def listdir(self, path):
+        """List the files and directories in path, as os.listdir does"""
+        prefix = path.rstrip('/') + '/'
+        entries = set()
+        for name in self._files:
+            if name.startswith(prefix):
+                entries.add(name[len(prefix):].split('/', 1)[0])
+        if not entries:
+            raise FileNotFoundError('No directory %s in %s' %
+                                    (path, self.path))
+        return sorted(entries)
+
+    def isdir(self, path):
+        prefix = path.rstrip('/') + '/'
+        return any(name.startswith(prefix) for name in self._files)
+
+    def read(self, path):
+        return self._zfile.read(path)
+
+    def load_json(self, path):
+        return json.loads(self.read(path).decode('utf-8'))
+
+    def source(self, path):
+        """Return the source of path for the ConversionQueue"""
+        return (self.path, path)
+
+class LinkCatalog(object):
+    """Links of all the locales in the CMS zip file
+
+    Each links/<locale>.json file is parsed only once, and then the
+    merged links of the content folder, the link desktop files and the
+    link icons are all generated from the parsed categories.
+    """
+
+    def __init__(self, archive):
+        json_files = set(name for name in archive.listdir(LINKS_SOURCE_DIR)
+                         if name.endswith('.json'))
+        # The Mexican links are split from the Spanish ones below
+        json_files.add('es-mx.json')
+
+        # Categories of each locale, in order of file name
+        self._categories = {}
+        for name in sorted(json_files):
+            locale = posixpath.splitext(name)[0]
+            if locale == 'es-mx':
+                self._categories[locale] = []
+            else:
+                path = posixpath.join(LINKS_SOURCE_DIR, name)
+                self._categories[locale] = archive.load_json(path)
+
+        # Split the Spanish links by Global vs. Mexico
+        # Unlike Guatemala, which is treated via a separate language
+        # in the CMS, we don't have a separate language for Mexico
+        spanish = self._categories['es']
+        for locale, region in [['es', 'Global'], ['es-mx', 'Mexico']]:
+            self._categories[locale] = [
+                dict(category, links=[link for link in category['links']
+                                      if link['linkRegion'] == region])
+                for category in spanish
+            ]
+
+    def get_links(self, locale):
+        """Iterate over the links of locale, in order of category"""
+        for category in self._categories[locale]:
+            for link in category['links']:
+                yield link
+
+    def get_merged_categories(self, locales):
+        """Merge the categories of several locales
+
+        The links of categories with the same name are concatenated,
+        in order of locale, and then sorted by ID.
+        """
+        merged = {}
+        for locale in locales:
+            for category in self._categories[locale]:
+                name = category['category']
+                if name in merged:
+                    merged[name]['links'] += category['links']
+                else:
+                    merged[name] = dict(category,
+                                        links=list(category['links']))
+        for category in merged.values():
+            category['links'].sort(key=operator.itemgetter('linkId'))
+        return list(merged.values())
+
+    def get_icon_links(self):
+        """Return the links of all the locales, indexed by ID
+
+        Since the icons only depend on the ID, the data of each link
+        is the one in the last locale that has it.
+        """
+        links = {}
+        for locale in self._categories:
+            for link in self.get_links(locale):
+                links[link['linkId']] = link
+        return links
 
 # Return the path to the default designer icon, or None if it doesn't exist
 def get_icon_path(linkJSON):
@@ -68,476 +210,454 @@ def get_icon_path(linkJSON):
         return None
     return linkJSON['linkIcon']
 
-# For Endless apps, try removing the trailing locale ('.xx' or '.xx_YY')
-# from the app id
-def strip_locale(app_id):
-    if not app_id.startswith('com.endlessm.'):
-        return None
-    if app_id[len(app_id) - 3] == '.':
-        return app_id[0 : len(app_id) - 3]
-    if app_id[len(app_id) - 3] == '_' and app_id[len(app_id) - 6] == '.':
-        return app_id[0 : len(app_id) - 6]
-    return None
-
-if __name__ == '__main__':
-
-    from argparse import ArgumentParser
-    parser = ArgumentParser(description='Generate desktop files')
-    parser.add_argument('zipfile', nargs='?', default=ZIP_FILENAME,
-                        help='zip file to unpack')
-    args = parser.parse_args()
+class ContentImporter(object):
+    """Import the CMS zip file into the content and data directories
+
+    The import is split into named phases, listed in PHASES, which must
+    be run in order, since each phase uses the output of the previous
+    ones. Image conversions are queued and run in parallel, so each
+    phase that converts images runs them all before it finishes.
+    """
+
+    PHASES = [
+        'unzip',
+        'thumbnails',
+        'screenshots',
+        'json',
+        'links',
+        'desktop',
+        'translation',
+        'icons',
+        'manifests'
+    ]
+
+    def __init__(self, zip_filename, output_dir='.', backend=None, jobs=None,
+                 cache_dir=None, manifest_formats=None):
+        self._zip_filename = zip_filename
+        self._jobs = jobs
+        self._manifest_formats = manifest_formats or DEFAULT_MANIFEST_FORMATS
+
+        # All the generated files are written in the output directory,
+        # while the other inputs are still read from the current directory,
+        # so that this can run from a read-only checkout
+        self.content_dir = os.path.join(output_dir, CONTENT_DIR)
+        self.links_dir = os.path.join(output_dir, LINKS_DIR)
+        self.bundle_apps_dir = os.path.join(output_dir, BUNDLE_APPS_DIR)
+        self.folders_dir = os.path.join(output_dir, FOLDERS_DIR)
+        self.bundle_manifests_dir = os.path.join(output_dir,
+                                                 BUNDLE_MANIFESTS_DIR)
+        self.bundle_icon_dir = os.path.join(output_dir, BUNDLE_ICON_DIR)
+        self.core_icon_dir = os.path.join(output_dir, CORE_ICON_DIR)
+
+        self.converter = ConversionQueue(backend or DEFAULT_BACKEND,
+                                         jobs, cache_dir)
+        self.archive = None
+        self.links = None
+        self.apps_json = None
+        self.desktop_objects = None
+        self.desktop_in_files = None
+
+    def run(self, phase_hook=None):
+        """Run all the phases in order
+
+        If given, phase_hook is called with the name of each phase,
+        and must return a context manager that is entered while
+        the phase runs.
+        """
+        for phase in self.PHASES:
+            if phase_hook:
+                with phase_hook(phase):
+                    getattr(self, 'do_' + phase)()
+            else:
+                getattr(self, 'do_' + phase)()
+
+    def do_unzip(self):
+        if self.converter.prepare() != 0:
+            raise RuntimeError('Could not prepare the imaging backend')
+
+        # Remove the existing content dir, if it exists
+        shutil.rmtree(self.content_dir, IGNORE_ERRORS)
+
+        # Note: the zip file does not currently match
+        # the requirements of the app store, so individual files
+        # are read from it and processed into the app store
+        # content directory
+        archive = ContentArchive(self._zip_filename)
+        self.archive = archive
+
+        # Although the CMS allows thumbnails to be provided as PNG,
+        # we really want them to be JPG, both due to the smaller
+        # compressed size and due to this script processing the PNG
+        # files in such a way that every run of the script would
+        # create useless metadata changes that lead to extra
+        # git commits
+        # Perhaps we could convert them here, but for now let's push
+        # back and make sure they are in the CMS in the correct format
+        png_thumbs = []
+        thumbs_dir = posixpath.join('apps', 'thumbs')
+        for filename in archive.listdir(thumbs_dir):
+            if filename.endswith('.png'):
+                png_thumbs.append(filename)
+        if png_thumbs:
+            print('Please replace the following PNG assets in the CMS with JPG:')
+            for filename in png_thumbs:
+                print(filename)
+            exit()
+
+        self.links = LinkCatalog(archive)
+
+    def _convert_dir(self, source_dir, target_dir):
+        os.makedirs(target_dir)
+        for source in self.archive.listdir(source_dir):
+            target = source
+            source_file = self.archive.source(posixpath.join(source_dir, source))
+            target_file = os.path.join(target_dir, target)
+            self.converter.convert(source_file, target_file)
+
+    def do_thumbnails(self):
+        resources_dir = os.path.join(self.content_dir, 'apps', 'resources')
+
+        # Copy the thumbnail images to the content folder
+        # with tweaked compression
+        self._convert_dir(posixpath.join('apps', 'thumbs'),
+                          os.path.join(resources_dir, 'thumbnails'))
+
+        # Copy the featured images to the content folder
+        # with tweaked compression
+        # (Note: if the featured image is square, we just use the thumbnail)
+        self._convert_dir(posixpath.join('apps', 'featured'),
+                          os.path.join(resources_dir, 'images'))
+
+        # Copy the splash screen images to the content folder
+        # with tweaked compression
+        self._convert_dir(posixpath.join('apps', 'splash'),
+                          os.path.join(resources_dir, 'splash'))
+
+        self.converter.run()
+
+    def do_screenshots(self):
+        # Copy the screenshot images to the content folder
+        # resized to a width of 480 pixels,
+        # converting PNG to JPG as necessary
+        # (Note: if the featured image is square, we just use the thumbnail)
+        for i in range(0, len(LOCALES)):
+            if LANGUAGES[i]:
+                # For now, we need to replace the CMS locale with generic language
+                # in the folder names
+                source_dir = posixpath.join('apps', 'screenshots', LOCALES[i])
+                if not self.archive.isdir(source_dir):
+                    continue
+                target_dir = os.path.join(self.content_dir, 'apps', 'resources',
+                                          'screenshots', LANGUAGES[i])
+                os.makedirs(target_dir)
+                for source in self.archive.listdir(source_dir):
+                    target = source.replace('.png', '.jpg')
+                    fourth_screenshot_idx = target.find('4.jpg')
+                    if fourth_screenshot_idx > 0:
+                        print('Warning: ' + LANGUAGES[i] + ' ' +
+                              target[0:fourth_screenshot_idx] +
+                              ' has more than 3 screenshots')
+                    source_file = self.archive.source(
+                        posixpath.join(source_dir, source))
+                    target_file = os.path.join(target_dir, target)
+                    # Resize to a width of 480, allowing an arbitrary height
+                    self.converter.convert(source_file, target_file, (480, 480))
+
+        # Finish converting the screenshots before any of them
+        # are moved to the fallback locale in the json phase
+        self.converter.run()
+
+    def do_json(self):
+        # Copy the app json to the content folder
+        # with tweaks to the json content
+        source = posixpath.join('apps', 'content.json')
+        target_dir = os.path.join(self.content_dir, 'apps')
+        target = os.path.join(target_dir, 'content.json')
+        json_data = json.loads(self.archive.read(source).decode('utf-8'))
+
+        # Write the JSON file sorted alphabetically by id, and with keys
+        # sorted so that application-id is first (for convenience in
+        # manually reviewing the file), and with extra categories included
+        # (and with trailing semicolon to match the freedesktop spec) Also,
+        # if there is only one screenshot language, let's force it to be "C"
+        # so that we have a fallback for all locales.
+        for app_data in json_data:
+            app_id = app_data['application-id']
+            # For now, we need to replace the CMS locales of the screenshots
+            # with generic languages, and the screenshots are converted
+            # to JPG as in the screenshots phase
+            app_data['screenshots'] = get_screenshot_languages(
+                app_data['screenshots'])
+            if not app_data.get('category', None):
+                raise ValueError('No category for App ID %s' % app_id)
+            categories = app_data['category'] + ';'
+            extra_categories = EXTRA_CATEGORIES.get(app_id, [])
+            if not extra_categories:
+                generic_id = strip_locale(app_id)
+                if generic_id:
+                    extra_categories = EXTRA_CATEGORIES.get(generic_id, [])
+            for extra_category in extra_categories:
+                categories += extra_category + ';'
+            app_data['category'] = categories
+            screenshots = app_data['screenshots']
+            if len(screenshots) == 1:
+                locale = list(screenshots.keys())[0]
+                if locale != 'C':
+                    new_screenshots = dict()
+                    screenshot_list = screenshots[locale]
+                    new_screenshots['C'] = screenshot_list
+                    app_data['screenshots'] = new_screenshots
+                    source_dir = os.path.join(self.content_dir, 'apps',
+                                              'resources', 'screenshots',
+                                              locale)
+                    target_dir = os.path.join(self.content_dir, 'apps',
+                                              'resources', 'screenshots', 'C')
+                    for fname in screenshot_list:
+                        shutil.move(os.path.join(source_dir, fname),
+                                    os.path.join(target_dir, fname))
+
+        # Merge in translation information to be used in AppData
+        merge_translation_info(json_data)
+
+        sorted_json = sorted(json_data, key=operator.itemgetter('application-id'))
 
-    # Create the icon mask for cropping with rounded corners
-    # Note: 61,61 is the bottom-right coordinate, not the size
-    # of the rounded rectangle (which is 60x60 in this case)
-    os.system('convert -size 64x64 xc:none ' +
-              '-draw "roundrectangle 2,2,61,61,15,15" ' + ICON_MASK)
-
-    # Remove the existing unzipped and content dirs, if they exist
-    shutil.rmtree(UNZIP_DIR, IGNORE_ERRORS)
-    shutil.rmtree(CONTENT_DIR, IGNORE_ERRORS)
-
-    # Note: the unzipped directory does not currently match
-    # the requirements of the app store, so we first unzip
-    # into a staging area, and then copy individual files/folders
-    # to the app store content directory
-
-    # Unzip the file
-    zfile = zipfile.ZipFile(args.zipfile)
-    zfile.extractall(UNZIP_DIR)
-
-    # Although the CMS allows thumbnails to be provided as PNG,
-    # we really want them to be JPG, both due to the smaller
-    # compressed size and due to this script processing the PNG
-    # files in such a way that every run of the script would
-    # create useless metadata changes that lead to extra
-    # git commits
-    # Perhaps we could convert them here, but for now let's push
-    # back and make sure they are in the CMS in the correct format
-    png_thumbs = []
-    thumbs_dir = os.path.join(UNZIP_DIR, 'apps', 'thumbs')
-    for filename in os.listdir(thumbs_dir):
-        if filename.endswith('.png'):
-            png_thumbs.append(filename)
-    if png_thumbs:
-        print('Please replace the following PNG assets in the CMS with JPG:')
-        for filename in png_thumbs:
-            print(filename)
-        exit()
-
-    # Split the Spanish links by Global vs. Mexico
-    # Unlike Guatemala, which is treated via a separate language
-    # in the CMS, we don't have a separate language for Mexico
-    json_dir = os.path.join(UNZIP_DIR, 'links')
-    es_path = os.path.join(json_dir, 'es.json')
-    mx_path = os.path.join(json_dir, 'es-mx.json')
-    with open(es_path) as infile:
-        json_data = json.load(infile)
-    for path, region in [[es_path, 'Global'], [mx_path, 'Mexico']]:
-        json_copy = copy.deepcopy(json_data)
-        for category in json_copy:
-            links = category['links']
-            # Iterate over a copy of the list, since it is not safe
-            # to remove an item from a list being iterated
-            for link in list(links):
-                link_region = link['linkRegion']
-                if link_region != region:
-                    links.remove(link)
-        with open(path, 'w') as outfile:
-            json.dump(json_copy, outfile, indent=2)
-
-    # For now, we need to convert specific locales to personalities,
-    # including duplication of en-us as both default and Global,
-    # until the CMS is reworked
-    locales = ['en-us', 'en-us', 'es-gt', 'pt-br', 'zh_CN', 'ar', 'bn', 'id', 'th', 'vi']
-    personalities = ['default', 'Global', 'Guatemala', 'Brazil', 'China', 'Arabic', 'Bengali', 'Indonesia', 'Thailand', 'Vietnam']
-
-    # For now, we also need to convert specific locales to general languages
-    # (with 'C' as the fallback for English) and personalities,
-    # until the CMS is reworked
-    languages = [None, 'C', 'es', 'pt', 'zh_CN', 'ar', 'bn', 'id', 'th', 'vi']
-
-    # Copy the thumbnail images to the content folder
-    # with tweaked compression
-    source_dir = os.path.join(UNZIP_DIR, 'apps', 'thumbs')
-    target_dir = os.path.join(CONTENT_DIR, 'apps', 'resources', 'thumbnails')
-    os.makedirs(target_dir)
-    for source in os.listdir(source_dir):
-        target = source
-        source_file = os.path.join(source_dir, source)
-        target_file = os.path.join(target_dir, target)
-        convert(source_file, target_file, '')
-
-    # Copy the featured images to the content folder
-    # with tweaked compression
-    # (Note: if the featured image is square, we just use the thumbnail)
-    source_dir = os.path.join(UNZIP_DIR, 'apps', 'featured')
-    target_dir = os.path.join(CONTENT_DIR, 'apps', 'resources', 'images')
-    os.makedirs(target_dir)
-    for source in os.listdir(source_dir):
-        target = source
-        source_file = os.path.join(source_dir, source)
-        target_file = os.path.join(target_dir, target)
-        convert(source_file, target_file, '')
-
-    # Copy the screenshot images to the content folder
-    # resized to a width of 480 pixels,
-    # converting PNG to JPG as necessary
-    # (Note: if the featured image is square, we just use the thumbnail)
-    for i in range(0, len(locales)):
-        if languages[i]:
-            # For now, we need to replace the CMS locale with generic language
-            # in the folder names
-            source_dir = os.path.join(UNZIP_DIR, 'apps', 'screenshots', locales[i])
-            if not os.path.isdir(source_dir):
-                continue
-            target_dir = os.path.join(CONTENT_DIR, 'apps', 'resources',
-                                      'screenshots', languages[i])
-            os.makedirs(target_dir)
-            for source in os.listdir(source_dir):
-                target = source.replace('.png', '.jpg')
-                fourth_screenshot_idx = target.find('4.jpg')
-                if fourth_screenshot_idx > 0:
-                    print('Warning: ' + languages[i] + ' ' +
-                          target[0:fourth_screenshot_idx] +
-                          ' has more than 3 screenshots')
-                source_file = os.path.join(source_dir, source)
-                target_file = os.path.join(target_dir, target)
-                # Resize to a width of 480, allowing an arbitrary height
-                convert(source_file, target_file,
-                        '-resize 480x480')
-
-    # Copy the splash screen images to the content folder
-    # with tweaked compression
-    source_dir = os.path.join(UNZIP_DIR, 'apps', 'splash')
-    target_dir = os.path.join(CONTENT_DIR, 'apps', 'resources', 'splash')
-    os.makedirs(target_dir)
-    for source in os.listdir(source_dir):
-        target = source
-        source_file = os.path.join(source_dir, source)
-        target_file = os.path.join(target_dir, target)
-        convert(source_file, target_file, '')
-
-    # Copy the app json to the content folder
-    # with tweaks to the json content
-    source = os.path.join(UNZIP_DIR, 'apps', 'content.json')
-    target_dir = os.path.join(CONTENT_DIR, 'apps')
-    target = os.path.join(target_dir, 'content.json')
-    infile = open(source, 'r')
-    outfile = open(target, 'w')
-    for line in infile:
-        for i in range(0, len(locales)):
-            if languages[i]:
-                from_string = '"' + locales[i] + '"'
-                to_string = '"' + languages[i] + '"'
-                line = line.replace(from_string, to_string)
-        if (line.find('-screenshot') >= 0):
-            line = line.replace('.png', '.jpg')
-        outfile.write(line)
-    infile.close()
-    outfile.close()
-
-    # Re-write the JSON file sorted alphabetically by id, and with keys
-    # sorted so that application-id is first (for convenience in
-    # manually reviewing the file), and with extra categories included
-    # (and with trailing semicolon to match the freedesktop spec) Also,
-    # if there is only one screenshot language, let's force it to be "C"
-    # so that we have a fallback for all locales.
-    with open(target) as infile:
-        json_data = json.load(infile)
-    for app_data in json_data:
-        app_id = app_data['application-id']
-        if not app_data.get('category', None):
-            raise ValueError('No category for App ID %s' % app_id)
-        categories = app_data['category'] + ';'
-        extra_categories = EXTRA_CATEGORIES.get(app_id, [])
-        if not extra_categories:
-            generic_id = strip_locale(app_id)
-            if generic_id:
-                extra_categories = EXTRA_CATEGORIES.get(generic_id, [])
-        for extra_category in extra_categories:
-            categories += extra_category + ';'
-        app_data['category'] = categories
-        screenshots = app_data['screenshots']
-        if len(screenshots) == 1:
-            locale = list(screenshots.keys())[0]
-            if locale != 'C':
-                new_screenshots = dict()
-                screenshot_list = screenshots[locale]
-                new_screenshots['C'] = screenshot_list
-                app_data['screenshots'] = new_screenshots
-                source_dir = os.path.join(CONTENT_DIR, 'apps', 'resources',
-                                          'screenshots', locale)
-                target_dir = os.path.join(CONTENT_DIR, 'apps', 'resources',
-                                          'screenshots', 'C')
-                for fname in screenshot_list:
-                    shutil.move(os.path.join(source_dir, fname),
-                                os.path.join(target_dir, fname))
-
-    # Merge in translation information to be used in AppData
-    merge_translation_info(json_data)
-
-    sorted_json = sorted(json_data, key=operator.itemgetter('application-id'))
-
-    with open(target, 'w') as outfile:
-        json.dump(sorted_json, outfile, indent=2, sort_keys=True)
-
-    # Special handling of link locales for es vs. es_GT
-    link_locales = [['en-us'], ['es'], ['es', 'es-gt'], ['es', 'es-mx'], ['pt-br'], ['zh-hans'], ['bn'], ['id'], ['th'], ['vi']]
-    link_languages = ['C', 'es', 'es_GT', 'es_MX', 'pt_BR', 'zh_CN', 'bn', 'id', 'th', 'vi']
-
-    # Copy and rename the links json to the content folder
-    source_dir = os.path.join(UNZIP_DIR, 'links')
-    target_dir = os.path.join(CONTENT_DIR, 'links')
-    os.makedirs(target_dir)
-    for i in range(0, len(link_locales)):
-        # For now, we need to replace the CMS locale with language
-        # in the file names
-        json_data = []
-        for locale in link_locales[i]:
-            source = os.path.join(source_dir, locale + '.json')
-
-            with open(source) as infile:
-                locale_data = json.load(infile)
-            for category in locale_data:
-                category_name = category['category']
-                found = False
-                for json_category in json_data:
-                    if json_category['category'] == category_name:
-                        found = True
-                        json_category['links'] += category['links']
-                if not found:
-                    json_data.append(category)
-
-        # Write the JSON file sorted alphabetically by id
-        # and with keys sorted
-        # (for convenience in manually reviewing the file)
-        for category in json_data:
-            sorted_links = sorted(category['links'],
-                                  key=operator.itemgetter('linkId'))
-            category['links'] = sorted_links
-        target = os.path.join(target_dir, link_languages[i] + '.json')
         with open(target, 'w') as outfile:
-            json.dump(json_data, outfile, indent=2, sort_keys='True')
-
-    # Copy the link images to the content folder
-    # resized/cropped to 90x90
-    source_dir = os.path.join(UNZIP_DIR, 'links', 'images')
-    target_dir = os.path.join(CONTENT_DIR, 'links', 'images')
-    os.makedirs(target_dir)
-    for source in os.listdir(source_dir):
-        target = source
-        source_file = os.path.join(source_dir, source)
-        target_file = os.path.join(target_dir, target)
-        # In case the image is rectangular,
-        # first resize so that the smallest dimension is 90 pixels,
-        # then crop from the center to exactly 90x90
-        convert(source_file, target_file,
-                '-resize 90x90^ -gravity center -crop 90x90+0+0')
-
-    # Note: we currently ignore the folder icons in the icons folder
-    # They are .png files, where we currently need .svg files
-    # Folder icons are currently managed in eos-theme
-
-    # Generate .desktop files
-
-    # Remove the existing desktop dirs, if they exist
-    shutil.rmtree(LINKS_DIR, IGNORE_ERRORS)
-    shutil.rmtree(BUNDLE_APPS_DIR, IGNORE_ERRORS)
-    shutil.rmtree(FOLDERS_DIR, IGNORE_ERRORS)
-
-    # Make the desktop dirs
-    os.makedirs(LINKS_DIR)
-    os.makedirs(BUNDLE_APPS_DIR)
-    os.makedirs(FOLDERS_DIR)
-
-    # Each app/link will be indexed by its id, so that duplicates
-    # (resulting from different locales) will be merged for i18n
-    desktop_objects = {}
-
-    # For now, links are stored on a per-locale basis in JSON files.
-    # The output desktop file should combine all specified URLs,
-    # switching on the locale via eos-exec-localized
-    for i in range(0, len(link_locales)):
-        # Note: link locales are ordered so that the one of interest here
-        # (i.e., the most localized) is the last one in the list
-        locale = link_locales[i][-1]
-        lang = locale.split('-')[0]
-        localized_link_path = os.path.join(UNZIP_DIR, 'links', locale + '.json')
-        localized_link_file = open(localized_link_path)
-        localized_link_json = json.load(localized_link_file)
-        localized_link_file.close()
-        for category in localized_link_json:
-            for link_data in category['links']:
+            json.dump(sorted_json, outfile, indent=2, sort_keys=True)
+
+    def do_links(self):
+        # Copy and rename the links json to the content folder
+        target_dir = os.path.join(self.content_dir, 'links')
+        os.makedirs(target_dir)
+        for i in range(0, len(LINK_LOCALES)):
+            # For now, we need to replace the CMS locale with language
+            # in the file names
+            # Write the JSON file sorted alphabetically by id
+            # and with keys sorted
+            # (for convenience in manually reviewing the file)
+            json_data = self.links.get_merged_categories(LINK_LOCALES[i])
+            target = os.path.join(target_dir, LINK_LANGUAGES[i] + '.json')
+            with open(target, 'w') as outfile:
+                json.dump(json_data, outfile, indent=2, sort_keys='True')
+
+        # Copy the link images to the content folder
+        # resized/cropped to 90x90
+        source_dir = posixpath.join('links', 'images')
+        target_dir = os.path.join(self.content_dir, 'links', 'images')
+        os.makedirs(target_dir)
+        for source in self.archive.listdir(source_dir):
+            target = source
+            source_file = self.archive.source(posixpath.join(source_dir, source))
+            target_file = os.path.join(target_dir, target)
+            # In case the image is rectangular,
+            # first resize so that the smallest dimension is 90 pixels,
+            # then crop from the center to exactly 90x90
+            self.converter.convert(source_file, target_file, (90, 90), crop=True)
+
+        self.converter.run()
+
+        # Note: we currently ignore the folder icons in the icons folder
+        # They are .png files, where we currently need .svg files
+        # Folder icons are currently managed in eos-theme
+
+    def do_desktop(self):
+        # Generate .desktop files
+
+        # Remove the existing desktop dirs, if they exist
+        shutil.rmtree(self.links_dir, IGNORE_ERRORS)
+        shutil.rmtree(self.bundle_apps_dir, IGNORE_ERRORS)
+        shutil.rmtree(self.folders_dir, IGNORE_ERRORS)
+
+        # Make the desktop dirs
+        os.makedirs(self.links_dir)
+        os.makedirs(self.bundle_apps_dir)
+        os.makedirs(self.folders_dir)
+
+        # Each app/link will be indexed by its id, so that duplicates
+        # (resulting from different locales) will be merged for i18n
+        desktop_objects = {}
+
+        # For now, links are stored on a per-locale basis in JSON files.
+        # The output desktop file should combine all specified URLs,
+        # switching on the locale via eos-exec-localized
+        for i in range(0, len(LINK_LOCALES)):
+            # Note: link locales are ordered so that the one of interest here
+            # (i.e., the most localized) is the last one in the list
+            locale = LINK_LOCALES[i][-1]
+            lang = locale.split('-')[0]
+            for link_data in self.links.get_links(locale):
                 id = 'eos-link-' + link_data['linkId']
-                if id not in desktop_objects.keys():
-                    desktop_objects[id] = LinkObject(link_data, LINKS_DIR, lang)
+                if id not in desktop_objects:
+                    desktop_objects[id] = LinkObject(link_data,
+                                                     self.links_dir, lang)
                 else:
                     name = link_data['linkName']
                     desktop_objects[id].append_localized_name(lang, name)
                     url = link_data['linkUrl']
                     desktop_objects[id].append_localized_url(lang, url)
 
-    apps_path = os.path.join(CONTENT_DIR, 'apps', 'content.json')
-    apps_file = open(apps_path)
-    apps_json = json.load(apps_file)
-    apps_file.close()
-    for app_data in apps_json:
-        id = app_data['application-id']
-        desktop_objects[id] = AppObject(app_data, BUNDLE_APPS_DIR)
-
-    # For now, the folders.json is not in the CMS output,
-    # so we hard-code it in the directory above the processed content
-    folders_path = os.path.join(CONTENT_DIR, '..', 'folders.json')
-    folders_file = open(folders_path)
-    folders_json = json.load(folders_file)
-    folders_file.close()
-    for folders_data in folders_json:
-        id = folders_data['folderId']
-        desktop_objects[id] = FolderObject(folders_data, FOLDERS_DIR)
-
-    # For each of the parsed links/apps/folders, output a .in file
-    # (desktop.in for links/apps, directory.in for folders)
-    for id, obj in desktop_objects.items():
-        desktop_path = obj.get_desktop_path()
-        desktop_file = open(desktop_path, 'w')
-        desktop_file.write('[Desktop Entry]\n')
-
-        for key in obj.DESKTOP_KEYS:
-           obj.write_key(desktop_file, key)
-
-        # XXX: We need to add a few more entries based on which app we're
-        # processing that we don't have support in the CMS for
-        extra_entries = EXTRA_DESKTOP_ENTRIES.get(id, {})
-        for key, value in extra_entries.items():
-            desktop_file.write("{}={}".format(key, value))
-
-        desktop_file.close()
-
-    # Translate the .in files we generated
-    translate_dir(LINKS_DIR)
-    translate_dir(BUNDLE_APPS_DIR)
-    translate_dir(FOLDERS_DIR)
-
-    # Remove the existing icon dirs, if they exists
-    shutil.rmtree(BUNDLE_ICON_DIR, IGNORE_ERRORS)
-    shutil.rmtree(CORE_ICON_DIR, IGNORE_ERRORS)
-
-    # Make the icon dirs
-    os.makedirs(BUNDLE_ICON_DIR)
-    os.makedirs(CORE_ICON_DIR)
-
-    # Process and rename the app icons to the icon folder
-    source_dir = os.path.join(UNZIP_DIR, 'apps', 'icons')
-    for app_data in apps_json:
-        # Rename the icons from name-icon.png to eos-app-name.png
-        # Note that the CMS does not respect capitalization
-        # in the source icon name, so we need to generate the
-        # target file name based on the actual app ID
-        source = app_data['icon']
-        target = APP_PREFIX + app_data['application-id'] + '.png'
-        if app_data['core']:
-            target_dir = CORE_ICON_DIR
-        else:
-            target_dir = BUNDLE_ICON_DIR
-        source_file = os.path.join(source_dir, source)
-        target_file = os.path.join(target_dir, target)
-        round_icon(source_file, target_file, '')
-
-    # Process and rename the link icons to the icon folder
-    # If no link icon available, resize/crop the thumbnail image
-    source_dir = os.path.join(UNZIP_DIR, 'links')
-    target_dir = CORE_ICON_DIR
-
-    file_names = os.listdir(source_dir)
-
-    # Work around the fact that the CMS currently splits
-    # the links into separate JSON files by country
-    for file_name in file_names:
-        if file_name.endswith('.json'):
-            links_json = os.path.join(source_dir, file_name)
-
-            with open(links_json) as links_content:
-                link_data = json.load(links_content)
-                for category in link_data:
-                    for link in category['links']:
-                        icon_path = get_icon_path(link)
-                        target_file = os.path.join(target_dir, LINK_PREFIX + link['linkId'] + '.png')
-
-                        if icon_path is None:
-                            # Generate a new icon based on existing link image
-                            source_file = os.path.join(source_dir, 'images', link['linkId'] + '.jpg')
-                            round_icon(source_file, target_file,
-                                       '-resize 64x64^ -gravity center -crop 64x64+0+0')
-                        else:
-                            # Simply round existing icon asset to destination
-                            source_file = os.path.join(source_dir, icon_path)
-                            round_icon(source_file, target_file, '')
-
-    # Generate bundle manifests for the image builder by personality
-
-    shutil.rmtree(BUNDLE_MANIFESTS_DIR, IGNORE_ERRORS)
-    os.makedirs(BUNDLE_MANIFESTS_DIR)
-
-    # Map from personality to two-character language code(s)
-    langs = {}
-    for i in range(0, len(personalities)):
-        lang = locales[i].split('-')[0]
-        langs[personalities[i]] = lang
-    all_langs = list(set(langs.values()))
-
-    # For each personality, write a manifest of all the app bundles
-    # (useful in maintaining the image builder manifests in eos-obs-build)
-    for personality in personalities + ['all']:
-        app_ids = []
-        for id, obj in desktop_objects.items():
-            if isinstance(obj, AppObject) \
-                    and not obj.get('Core'):
-                if personality == 'default':
-                    continue
-                elif personality == 'all':
-                    app_ids.append(id)
-                else:
-                    app_personalities = obj.get('Personalities')
-                    if 'All' in app_personalities \
-                            or personality in app_personalities:
-                        app_ids.append(id)
-        app_ids.sort()
-        manifest_path = os.path.join(BUNDLE_MANIFESTS_DIR,
-                                     'bundle-manifest-%s.txt' % personality)
-        with open(manifest_path, 'w') as manifest_file:
-            for app in app_ids:
-                manifest_file.write(app + '\n')
-
-    # Generate a manifest of all the core apps
-    # (useful in maintaining the core list in eos-meta)
-    core_apps = []
-    for id, obj in desktop_objects.items():
-        if isinstance(obj, AppObject) and obj.get('Core'):
-            core_apps.append(id)
-    core_apps.sort()
-    manifest_path = os.path.join(BUNDLE_MANIFESTS_DIR, 'core-manifest.txt')
-    with open(manifest_path, 'w') as manifest_file:
-        for app in core_apps:
-            manifest_file.write(app + '\n')
-
-    # Generate a manifest of all the apps by category
-    category_apps = {}
-    for id, obj in desktop_objects.items():
-        if isinstance(obj, AppObject):
-            categories = obj.get('Categories')
-            # Drop the terminal ';' from the category list
-            categories = categories[:len(categories)-1]
-            for category in categories.split(';'):
-                if category not in category_apps:
-                    category_apps[category] = []
-                category_apps[category].append(id)
-    categories_path = os.path.join(BUNDLE_MANIFESTS_DIR, 'categories.txt')
-    with open(categories_path, 'w') as categories_file:
-        for category in sorted(category_apps.keys()):
-            categories_file.write(category + ':\n')
-            app_list = category_apps[category]
-            app_list.sort()
-            for app in app_list:
-                categories_file.write(app + '\n')
-            categories_file.write('\n')
+        apps_path = os.path.join(self.content_dir, 'apps', 'content.json')
+        apps_file = open(apps_path)
+        self.apps_json = json.load(apps_file)
+        apps_file.close()
+        for app_data in self.apps_json:
+            id = app_data['application-id']
+            desktop_objects[id] = AppObject(app_data, self.bundle_apps_dir)
+
+        folders_file = open(FOLDERS_JSON)
+        folders_json = json.load(folders_file)
+        folders_file.close()
+        for folders_data in folders_json:
+            id = folders_data['folderId']
+            desktop_objects[id] = FolderObject(folders_data, self.folders_dir)
+
+        # For each of the parsed links/apps/folders, render a .in file
+        # (desktop.in for links/apps, directory.in for folders) in memory,
+        # in order of id so that the output is deterministic
+        self.desktop_in_files = []
+        for id in sorted(desktop_objects):
+            obj = desktop_objects[id]
+            desktop_path = obj.get_desktop_path()
+            desktop_file = io.StringIO()
+            desktop_file.write('[Desktop Entry]\n')
+
+            for key in obj.DESKTOP_KEYS:
+               obj.write_key(desktop_file, key)
+
+            # XXX: We need to add a few more entries based on which app we're
+            # processing that we don't have support in the CMS for
+            extra_entries = EXTRA_DESKTOP_ENTRIES.get(id, {})
+            for key, value in extra_entries.items():
+                desktop_file.write("{}={}".format(key, value))
+
+            self.desktop_in_files.append((desktop_path, desktop_file.getvalue()))
+
+        self.desktop_objects = desktop_objects
+
+    def do_translation(self):
+        # Translate the .in files we rendered straight to the final
+        # .desktop and .directory files
+        for path, text in translate_all(self.desktop_in_files, self._jobs):
+            with open(path, 'w') as desktop_file:
+                desktop_file.write(text)
+
+    def do_icons(self):
+        # Remove the existing icon dirs, if they exists
+        shutil.rmtree(self.bundle_icon_dir, IGNORE_ERRORS)
+        shutil.rmtree(self.core_icon_dir, IGNORE_ERRORS)
+
+        # Make the icon dirs
+        os.makedirs(self.bundle_icon_dir)
+        os.makedirs(self.core_icon_dir)
+
+        # Process and rename the app icons to the icon folder
+        source_dir = posixpath.join('apps', 'icons')
+        for app_data in self.apps_json:
+            # Rename the icons from name-icon.png to eos-app-name.png
+            # Note that the CMS does not respect capitalization
+            # in the source icon name, so we need to generate the
+            # target file name based on the actual app ID
+            source = app_data['icon']
+            target = APP_PREFIX + app_data['application-id'] + '.png'
+            if app_data['core']:
+                target_dir = self.core_icon_dir
+            else:
+                target_dir = self.bundle_icon_dir
+            source_file = self.archive.source(posixpath.join(source_dir, source))
+            target_file = os.path.join(target_dir, target)
+            self.converter.round_icon(source_file, target_file)
+
+        # Process and rename the link icons to the icon folder
+        # If no link icon available, resize/crop the thumbnail image
+        # (the CMS currently splits the links into separate JSON files
+        # by country, so this covers the links of every country)
+        source_dir = LINKS_SOURCE_DIR
+        target_dir = self.core_icon_dir
+        for link_id, link in sorted(self.links.get_icon_links().items()):
+            icon_path = get_icon_path(link)
+            target_file = os.path.join(target_dir, LINK_PREFIX + link_id + '.png')
+
+            if icon_path is None:
+                # Generate a new icon based on existing link image
+                source_file = posixpath.join(source_dir, 'images', link_id + '.jpg')
+                self.converter.round_icon(
+                    self.archive.source(source_file), target_file,
+                    (ICON_SIZE, ICON_SIZE), crop=True)
+            else:
+                # Simply round existing icon asset to destination
+                source_file = posixpath.join(source_dir, icon_path)
+                self.converter.round_icon(
+                    self.archive.source(source_file), target_file)
+
+        self.converter.run()
+
+    def do_manifests(self):
+        # Generate bundle manifests for the image builder by personality
+
+        shutil.rmtree(self.bundle_manifests_dir, IGNORE_ERRORS)
+        os.makedirs(self.bundle_manifests_dir)
+
+        write_manifests(self.desktop_objects, PERSONALITIES,
+                        self.bundle_manifests_dir, self._manifest_formats)
+
+if __name__ == '__main__':
+
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description='Generate desktop files')
+    parser.add_argument('zipfile', nargs='?', default=ZIP_FILENAME,
+                        help='zip file to unpack')
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help='directory in which to write the generated ' +
+                        'files (default: the current directory)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of image conversions to run in ' +
+                        'parallel (default: number of CPUs)')
+    parser.add_argument('--cache-dir', default=CACHE_DIR,
+                        help='directory of previously converted images ' +
+                        '(default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='convert all images, ignoring the cache')
+    parser.add_argument('--backend', choices=sorted(BACKENDS),
+                        default=DEFAULT_BACKEND,
+                        help='imaging backend used to convert images ' +
+                        '(default: %(default)s)')
+    parser.add_argument('--manifest-format', action='append',
+                        choices=sorted(MANIFEST_WRITERS),
+                        help='format of the bundle manifests, which can ' +
+                        'be given more than once (default: %s)' %
+                        ', '.join(DEFAULT_MANIFEST_FORMATS))
+    parser.add_argument('--profile', action='store_true',
+                        help='report the time, processes and I/O ' +
+                        'of each phase, and the slowest assets')
+    parser.add_argument('--profile-slowest', type=int, default=10,
+                        metavar='N',
+                        help='number of slowest assets to report ' +
+                        '(default: %(default)s)')
+    parser.add_argument('--cprofile', metavar='FILE',
+                        help='profile the phases with cProfile, ' +
+                        'writing the statistics to FILE')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='write a Chrome trace of the phases ' +
+                        'and asset conversions to FILE')
+    args = parser.parse_args()
+
+    if args.no_cache:
+        cache_dir = None
+    else:
+        cache_dir = args.cache_dir
+    importer = ContentImporter(args.zipfile, args.output_dir, args.backend,
+                               args.jobs, cache_dir, args.manifest_format)
+    if args.profile or args.cprofile or args.trace:
+        profiler = ImportProfiler(importer.converter, bool(args.cprofile))
+    else:
+        profiler = None
+    importer.run(profiler)
+
+    importer.converter.print_summary()
+    if args.profile:
+        profiler.print_report(args.profile_slowest)
+    if args.cprofile:
+        profiler.write_cprofile(args.cprofile)
+    if args.trace:
+        profiler.write_trace(args.trace)
+    if importer.converter.failed:
+        exit(1)